@@ -1,223 +1,453 @@
-
-import datetime
-import json
-import logging
-import os
-from getpass import getpass
-from pathlib import Path
-
-import requests
-from garth.exc import GarthHTTPError
-
-import firebase_admin
-from firebase_admin import credentials, firestore
-
-from google.cloud import firestore as gcf  # Needed for ordering Firestore docs
-
-import warnings
-
-# Suppress the specific Firestore positional argument warning
-warnings.filterwarnings(
-    "ignore",
-    message="Detected filter using positional arguments.*",
-    category=UserWarning,
-    module="google.cloud.firestore"
-)
-
-# Path to your service account key (downloaded from Firebase Console)
-
-# Load credential path from environment variable
-cred_path = Path(__file__).parent / "firebase_key.json"
-cred = credentials.Certificate(cred_path)
-firebase_admin.initialize_app(cred)
-
-db = firestore.client()
-
-from garminconnect import (
-    Garmin,
-    GarminConnectAuthenticationError,
-    GarminConnectConnectionError,
-    GarminConnectTooManyRequestsError,
-)
-
-# Configure debug logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-logger.disabled = True
-
-
-# Load environment variables if defined
-email = os.getenv("EMAIL")
-password = os.getenv("PASSWORD")
-tokenstore = os.getenv("GARMINTOKENS") or "~/.garminconnect"
-tokenstore_base64 = os.getenv("GARMINTOKENS_BASE64") or "~/.garminconnect_base64"
-api = None
-
-# Example selections and settings
-
-# Let's say we want to scrape all activities using switch menu_option "p". We change the values of the below variables, IE startdate days, limit,...
-
-end_date = datetime.date.today()
-
-meta_ref = db.collection("users").document("kevin").collection("meta").document("garmin_sync")
-meta_doc = meta_ref.get()
-
-if meta_doc.exists:
-    last_scraped_date = meta_doc.to_dict().get("date")
-    start_date = datetime.datetime.strptime(last_scraped_date, "%Y-%m-%d").date()
-else:
-    start_date = datetime.date(2025, 1, 1)
-
-all_data = []
-
-def get_credentials():
-    """Get user credentials."""
-
-    email = input("Login e-mail: ")
-    password = getpass("Enter password: ")
-
-    return email, password
-
-def init_api(email, password):
-    """Initialize Garmin API with your credentials."""
-
-    try:
-        # Using Oauth1 and OAuth2 token files from directory
-        logger.info(f"Trying to login to Garmin Connect using token data from directory '{tokenstore}'...\n")
-
-        garmin = Garmin()
-        garmin.login(tokenstore)
-
-    except (FileNotFoundError, GarthHTTPError, GarminConnectAuthenticationError):
-        # Session is expired. You'll need to log in again
-        logger.info(
-            "Login tokens not present, login with your Garmin Connect credentials to generate them.\n"
-            f"They will be stored in '{tokenstore}' for future use.\n"
-        )
-        try:
-            # Ask for credentials if not set as environment variables
-            if not email or not password:
-                email, password = get_credentials()
-
-            garmin = Garmin(
-                email=email, password=password, is_cn=False, return_on_mfa=True
-            )
-            result1, result2 = garmin.login()
-            if result1 == "needs_mfa":  # MFA is required
-                mfa_code = get_mfa()
-                garmin.resume_login(result2, mfa_code)
-
-            # Save Oauth1 and Oauth2 token files to directory for next login
-            garmin.garth.dump(tokenstore)
-            logger.info(
-                f"Oauth tokens stored in '{tokenstore}' directory for future use. (first method)\n"
-            )
-
-            # Encode Oauth1 and Oauth2 tokens to base64 string and safe to file for next login (alternative way)
-            token_base64 = garmin.garth.dumps()
-            dir_path = os.path.expanduser(tokenstore_base64)
-            with open(dir_path, "w") as token_file:
-                token_file.write(token_base64)
-            logger.info(
-                f"Oauth tokens encoded as base64 string and saved to '{dir_path}' file for future use. (second method)\n"
-            )
-
-            # Re-login Garmin API with tokens
-            garmin.login(tokenstore)
-        except (
-            FileNotFoundError,
-            GarthHTTPError,
-            GarminConnectAuthenticationError,
-            requests.exceptions.HTTPError,
-        ) as err:
-            logger.error(err)
-            return None
-
-    return garmin
-
-def get_mfa():
-    """Get MFA."""
-
-    return input("MFA one-time code: ")
-
-
-# Init API
-if not api:
-    api = init_api(email, password)
-
-if api:
-    # Display menu
-        # Skip requests if login failed
-    try:
-        logger.info("Fetching data from Garmin...")
-        latest_saved_date = None
-        for day in range((end_date - start_date).days + 1):
-            date = start_date + datetime.timedelta(days=day)
-            weight = None
-            body_fat = None
-
-            try:
-                body_data = api.get_body_composition(date.isoformat())
-                total_avg = body_data.get("totalAverage", {})
-                weight_raw = total_avg.get("weight")
-                weight = round(weight_raw / 1000, 2) if weight_raw else None
-                body_fat = total_avg.get("bodyFat")
-            except Exception as e:
-                if "No data" in str(e) or "404" in str(e):
-                    logger.error(f"{date}: No data available.")
-                else:
-                    logger.error(f"{date}: Error – {e}")
-
-            logger.info(f"{date}: weight = {weight} kg, body fat = {body_fat} %")
-
-            # Save or update in Firebase
-            if weight is not None:
-                weight_collection = db.collection("users").document("kevin").collection("weight_data")
-
-                date_str = date.isoformat() 
-                latest_saved_date = date_str  # Update the latest saved date
-
-                # Get all existing docs for this date
-                existing_docs = weight_collection.where("date", "==", date_str).stream()
-                existing_weights = [doc.to_dict().get("weight") for doc in existing_docs]
-                doc_count = len(existing_weights)
-
-                if weight not in existing_weights:
-                    doc_id = f"{date_str}_{doc_count + 1}"
-                    weight_collection.document(doc_id).set({
-                        "date": date_str,
-                        "weight": weight,
-                        "bodyFat": body_fat,
-                        "scraped_at": datetime.datetime.now().isoformat(),
-                        "source": "garmin"
-                    })
-                    logger.info(f"📌 Saved new weight entry: {doc_id}")
-                #else:
-                    logger.error(f"➖ Weight for {date_str} already stored. Skipping.")
-
-        if latest_saved_date:
-            meta_ref.set({"date": latest_saved_date})
-            now = datetime.datetime.now()
-            print(f"{now.strftime('%Y-%m-%d %H:%M:%S')}: Garmin Scraper - ✅ Sync marker at: {latest_saved_date}")
-            # after successful Firestore write:
-            requests.get("https://fatboyslim.streamlit.app/?refresh=1")
-        else:
-            logger.error("⚠️ No new data saved. Meta date not updated.")
-
-    except (
-        GarminConnectConnectionError,
-        GarminConnectAuthenticationError,
-        GarminConnectTooManyRequestsError,
-        requests.exceptions.HTTPError,
-        GarthHTTPError,
-    ) as err:
-        logger.error(err)
-    except KeyError:
-        # Invalid menu option chosen
-        pass
-else:
-    logger.error("Could not login to Garmin Connect, try again later.")
-
-test = 1
-
-
+
+import datetime
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from getpass import getpass
+from pathlib import Path
+
+import requests
+from garth.exc import GarthHTTPError
+
+import firebase_admin
+from firebase_admin import credentials, firestore
+
+from google.cloud import firestore as gcf  # Needed for ordering Firestore docs
+
+import warnings
+
+# Suppress the specific Firestore positional argument warning
+warnings.filterwarnings(
+    "ignore",
+    message="Detected filter using positional arguments.*",
+    category=UserWarning,
+    module="google.cloud.firestore"
+)
+
+import scrape_metrics
+from firestore_sync import daily_doc_id, notify_dashboard
+from storage import open_storage
+
+
+def firestore_client():
+    """Firestore client from the service account key (downloaded from Firebase Console)."""
+    cred_path = Path(__file__).parent / "firebase_key.json"
+    cred = credentials.Certificate(cred_path)
+    firebase_admin.initialize_app(cred)
+    return firestore.client()
+
+
+# Firestore unless STORAGE_BACKEND says otherwise (see storage.py)
+storage = open_storage(firestore_client)
+
+from garminconnect import (
+    Garmin,
+    GarminConnectAuthenticationError,
+    GarminConnectConnectionError,
+    GarminConnectTooManyRequestsError,
+)
+
+# Configure debug logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+logger.disabled = True
+
+
+# Load environment variables if defined
+email = os.getenv("EMAIL")
+password = os.getenv("PASSWORD")
+tokenstore = os.getenv("GARMINTOKENS") or "~/.garminconnect"
+tokenstore_base64 = os.getenv("GARMINTOKENS_BASE64") or "~/.garminconnect_base64"
+api = None
+
+# Example selections and settings
+
+# Let's say we want to scrape all activities using switch menu_option "p". We change the values of the below variables, IE startdate days, limit,...
+
+end_date = datetime.date.today()
+
+# Days per get_body_composition() call. Garmin's weight/dateRange endpoint returns
+# every weigh-in in the window, so request count scales with chunks, not days.
+# Set to 1 to fall back to one call per day.
+chunk_days = max(1, int(os.getenv("GARMIN_CHUNK_DAYS", "28")))
+
+# Fetch engine: windows are fetched by a small worker pool that shares one
+# token bucket, so concurrency never exceeds Garmin's request rate.
+fetch_workers = max(1, int(os.getenv("GARMIN_WORKERS", "4")))
+requests_per_second = float(os.getenv("GARMIN_RATE", "1.0"))
+max_retries = int(os.getenv("GARMIN_MAX_RETRIES", "5"))
+backoff_base = float(os.getenv("GARMIN_BACKOFF_BASE", "2.0"))  # seconds
+
+# Backfill mode: GARMIN_BACKFILL_FROM=2023-01-01 imports the history from that
+# date (to GARMIN_BACKFILL_TO, default today) in batches instead of syncing from
+# the sync marker. Each batch is written before the garmin_backfill checkpoint
+# moves past it, so an interrupted import resumes where it stopped when run
+# again with the same start date. A batch is one round of windows for the workers.
+backfill_from = os.getenv("GARMIN_BACKFILL_FROM")
+backfill_to = os.getenv("GARMIN_BACKFILL_TO")
+backfill_batch_days = max(1, int(os.getenv("GARMIN_BACKFILL_BATCH_DAYS", str(chunk_days * fetch_workers))))
+
+# API calls, Firestore reads/writes, retries and errors of this run go to
+# metrics/ at exit (see scrape_metrics.py)
+scrape_metrics.start_run("garmin")
+
+with scrape_metrics.call(storage.name, "sync_marker_get", reads=1):
+    sync_meta = storage.get_meta("kevin", "garmin_sync")
+
+if sync_meta:
+    last_scraped_date = sync_meta.get("date")
+    start_date = datetime.datetime.strptime(last_scraped_date, "%Y-%m-%d").date()
+else:
+    start_date = datetime.date(2025, 1, 1)
+
+all_data = []
+
+def get_credentials():
+    """Get user credentials."""
+
+    email = input("Login e-mail: ")
+    password = getpass("Enter password: ")
+
+    return email, password
+
+def init_api(email, password):
+    """Initialize Garmin API with your credentials."""
+
+    try:
+        # Using Oauth1 and OAuth2 token files from directory
+        logger.info(f"Trying to login to Garmin Connect using token data from directory '{tokenstore}'...\n")
+
+        garmin = Garmin()
+        with scrape_metrics.call("api", "login"):
+            garmin.login(tokenstore)
+
+    except (FileNotFoundError, GarthHTTPError, GarminConnectAuthenticationError):
+        # Session is expired. You'll need to log in again
+        logger.info(
+            "Login tokens not present, login with your Garmin Connect credentials to generate them.\n"
+            f"They will be stored in '{tokenstore}' for future use.\n"
+        )
+        try:
+            # Ask for credentials if not set as environment variables
+            if not email or not password:
+                email, password = get_credentials()
+
+            garmin = Garmin(
+                email=email, password=password, is_cn=False, return_on_mfa=True
+            )
+            with scrape_metrics.call("api", "login"):
+                result1, result2 = garmin.login()
+            if result1 == "needs_mfa":  # MFA is required
+                mfa_code = get_mfa()
+                with scrape_metrics.call("api", "login"):
+                    garmin.resume_login(result2, mfa_code)
+
+            # Save Oauth1 and Oauth2 token files to directory for next login
+            garmin.garth.dump(tokenstore)
+            logger.info(
+                f"Oauth tokens stored in '{tokenstore}' directory for future use. (first method)\n"
+            )
+
+            # Encode Oauth1 and Oauth2 tokens to base64 string and safe to file for next login (alternative way)
+            token_base64 = garmin.garth.dumps()
+            dir_path = os.path.expanduser(tokenstore_base64)
+            with open(dir_path, "w") as token_file:
+                token_file.write(token_base64)
+            logger.info(
+                f"Oauth tokens encoded as base64 string and saved to '{dir_path}' file for future use. (second method)\n"
+            )
+
+            # Re-login Garmin API with tokens
+            with scrape_metrics.call("api", "login"):
+                garmin.login(tokenstore)
+        except (
+            FileNotFoundError,
+            GarthHTTPError,
+            GarminConnectAuthenticationError,
+            requests.exceptions.HTTPError,
+        ) as err:
+            logger.error(err)
+            scrape_metrics.error("login")
+            return None
+
+    return garmin
+
+def get_mfa():
+    """Get MFA."""
+
+    return input("MFA one-time code: ")
+
+def date_chunks(start_date, end_date, days):
+    """Split start_date..end_date (inclusive) into windows of at most `days` days."""
+
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        chunk_end = min(chunk_start + datetime.timedelta(days=days - 1), end_date)
+        yield chunk_start, chunk_end
+        chunk_start = chunk_end + datetime.timedelta(days=1)
+
+def daily_averages(body_data):
+    """Average the weigh-ins of a dateRange response per day: {date: (weight_kg, body_fat)}."""
+
+    days = {}
+    for entry in body_data.get("dateWeightList") or []:
+        if not entry.get("weight"):
+            continue
+        if entry.get("calendarDate"):
+            day = datetime.date.fromisoformat(entry["calendarDate"])
+        else:
+            day = datetime.datetime.fromtimestamp(entry["date"] / 1000).date()
+        weights, fats = days.setdefault(day, ([], []))
+        weights.append(entry["weight"])
+        if entry.get("bodyFat") is not None:
+            fats.append(entry["bodyFat"])
+
+    return {
+        day: (
+            round(sum(weights) / len(weights) / 1000, 2),
+            sum(fats) / len(fats) if fats else None,
+        )
+        for day, (weights, fats) in days.items()
+    }
+
+def fetch_body_composition(api, chunk_start, chunk_end):
+    """Fetch one window with a single API call and split it into days."""
+
+    with scrape_metrics.call("api", "get_body_composition"):
+        body_data = api.get_body_composition(chunk_start.isoformat(), chunk_end.isoformat())
+    return daily_averages(body_data)
+
+class TokenBucket:
+    """Thread-safe token bucket shared by all fetch workers."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent."""
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold back every worker, e.g. after Garmin answered 429."""
+
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+def fetch_with_backoff(api, bucket, chunk_start, chunk_end):
+    """Fetch one window, retrying rate-limit errors with exponential backoff."""
+
+    for attempt in range(max_retries + 1):
+        bucket.acquire()
+        try:
+            return fetch_body_composition(api, chunk_start, chunk_end)
+        except GarminConnectTooManyRequestsError:
+            if attempt == max_retries:
+                raise
+            scrape_metrics.retry("get_body_composition")
+            delay = backoff_base * 2 ** attempt + random.uniform(0, 1)
+            logger.warning(f"{chunk_start}..{chunk_end}: rate limited, retrying in {delay:.1f}s")
+            bucket.pause(delay)
+
+def fetch_all(api, chunks):
+    """Fetch all windows concurrently.
+
+    Returns ({date: (weight_kg, body_fat)}, [start dates of windows that failed]).
+    """
+
+    bucket = TokenBucket(requests_per_second, capacity=fetch_workers)
+    daily_data = {}
+    failed = []
+
+    with ThreadPoolExecutor(max_workers=fetch_workers) as pool:
+        futures = {
+            pool.submit(fetch_with_backoff, api, bucket, chunk_start, chunk_end): (chunk_start, chunk_end)
+            for chunk_start, chunk_end in chunks
+        }
+        for future in as_completed(futures):
+            chunk_start, chunk_end = futures[future]
+            try:
+                daily_data.update(future.result())
+            except Exception as e:
+                if "No data" in str(e) or "404" in str(e):
+                    logger.error(f"{chunk_start}..{chunk_end}: No data available.")
+                else:
+                    logger.error(f"{chunk_start}..{chunk_end}: Error – {e}")
+                    scrape_metrics.error("fetch_window")
+                    failed.append(chunk_start)
+
+    return daily_data, failed
+
+def queue_writes(daily_data, start_date, end_date):
+    """Storage writes for the days start_date..end_date that have a weight.
+
+    Returns ([(doc_id, data)], ISO date of the latest one or None).
+    """
+
+    writes = []
+    latest_saved_date = None
+    for day in range((end_date - start_date).days + 1):
+        date = start_date + datetime.timedelta(days=day)
+        weight, body_fat = daily_data.get(date, (None, None))
+
+        logger.info(f"{date}: weight = {weight} kg, body fat = {body_fat} %")
+
+        # Queue for storage; the doc ID is derived from the day, so a refetched
+        # day is rewritten instead of duplicated, even if its average changed
+        if weight is not None:
+            date_str = date.isoformat()
+            latest_saved_date = date_str  # Update the latest saved date
+
+            doc_id = daily_doc_id(date_str, "garmin")
+            writes.append((doc_id, {
+                "date": date_str,
+                "weight": weight,
+                "bodyFat": body_fat,
+                "source": "garmin"
+            }))
+
+    return writes, latest_saved_date
+
+def sync(api):
+    """Fetch everything from the sync marker to today and move the marker."""
+
+    logger.info("Fetching data from Garmin...")
+    daily_data, failed_chunks = fetch_all(api, date_chunks(start_date, end_date, chunk_days))
+
+    writes, latest_saved_date = queue_writes(daily_data, start_date, end_date)
+
+    if writes:
+        written = storage.put_weights("kevin", writes)
+        logger.info(f"📌 Saved {written} weight entries.")
+
+    # Never move the sync marker past a window that could not be fetched,
+    # so the next run picks it up again
+    if failed_chunks and latest_saved_date:
+        retry_from = min(failed_chunks) - datetime.timedelta(days=1)
+        latest_saved_date = min(latest_saved_date, retry_from.isoformat())
+        logger.error(f"⚠️ {len(failed_chunks)} window(s) failed; sync marker held at {latest_saved_date}.")
+
+    if latest_saved_date:
+        with scrape_metrics.call(storage.name, "sync_marker_set", writes=1):
+            storage.set_meta("kevin", "garmin_sync", {"date": latest_saved_date})
+        now = datetime.datetime.now()
+        print(f"{now.strftime('%Y-%m-%d %H:%M:%S')}: Garmin Scraper - ✅ Sync marker at: {latest_saved_date}")
+        # after successful Firestore write:
+        notify_dashboard("kevin", now.isoformat())
+    else:
+        logger.error("⚠️ No new data saved. Meta date not updated.")
+
+def backfill(api, first_date, last_date=None):
+    """Import first_date..last_date batch by batch, resuming at the garmin_backfill checkpoint.
+
+    The checkpoint holds the first day not yet imported. It only moves once a
+    batch is written, and stops at the first window that failed, so a crash
+    or a rate limit costs at most the batch in flight.
+    """
+
+    with scrape_metrics.call(storage.name, "backfill_checkpoint_get", reads=1):
+        checkpoint = storage.get_meta("kevin", "garmin_backfill") or {}
+
+    if checkpoint.get("from") == first_date.isoformat():
+        next_date = datetime.date.fromisoformat(checkpoint["next"])
+        last_date = last_date or datetime.date.fromisoformat(checkpoint["to"])
+        print(f"🔁 Resuming backfill from {first_date} at {next_date}")
+    else:
+        next_date = first_date
+        last_date = last_date or end_date
+        print(f"📆 Starting backfill {first_date}..{last_date}")
+
+    saved = 0
+    latest_saved_date = None
+    for batch_start, batch_end in date_chunks(next_date, last_date, backfill_batch_days):
+        daily_data, failed_chunks = fetch_all(api, date_chunks(batch_start, batch_end, chunk_days))
+        writes, batch_latest = queue_writes(daily_data, batch_start, batch_end)
+        if writes:
+            saved += storage.put_weights("kevin", writes)
+            latest_saved_date = batch_latest
+
+        # Windows after a failed one are written too (the doc IDs make that
+        # idempotent), but the next run refetches from the failed one on
+        next_date = min(failed_chunks) if failed_chunks else batch_end + datetime.timedelta(days=1)
+        with scrape_metrics.call(storage.name, "backfill_checkpoint_set", writes=1):
+            storage.set_meta("kevin", "garmin_backfill", {
+                "from": first_date.isoformat(),
+                "to": last_date.isoformat(),
+                "next": next_date.isoformat(),
+                "updated_at": datetime.datetime.now().isoformat(),
+            })
+        now = datetime.datetime.now()
+        print(f"{now.strftime('%Y-%m-%d %H:%M:%S')}: Garmin Backfill - 💾 {batch_start}..{batch_end}: "
+              f"{len(writes)} days saved, checkpoint at {next_date}")
+
+        if failed_chunks:
+            logger.error(f"⚠️ {len(failed_chunks)} window(s) failed; run again to resume at {next_date}.")
+            print(f"⚠️ Backfill stopped at {next_date}; run again to resume.")
+            break
+    else:
+        print(f"✅ Backfill {first_date}..{last_date} complete, {saved} weight entries saved this run.")
+        # Let the regular sync carry on from there rather than refetch it
+        if latest_saved_date and (not sync_meta or latest_saved_date > sync_meta.get("date", "")):
+            with scrape_metrics.call(storage.name, "sync_marker_set", writes=1):
+                storage.set_meta("kevin", "garmin_sync", {"date": latest_saved_date})
+            print(f"✅ Sync marker at: {latest_saved_date}")
+
+    if saved:
+        notify_dashboard("kevin", datetime.datetime.now().isoformat())
+
+
+# Init API
+if not api:
+    api = init_api(email, password)
+
+if api:
+    # Display menu
+        # Skip requests if login failed
+    try:
+        if backfill_from:
+            backfill(
+                api,
+                datetime.date.fromisoformat(backfill_from),
+                datetime.date.fromisoformat(backfill_to) if backfill_to else None,
+            )
+        else:
+            sync(api)
+
+    except (
+        GarminConnectConnectionError,
+        GarminConnectAuthenticationError,
+        GarminConnectTooManyRequestsError,
+        requests.exceptions.HTTPError,
+        GarthHTTPError,
+    ) as err:
+        logger.error(err)
+        scrape_metrics.error("sync")
+    except KeyError:
+        # Invalid menu option chosen
+        pass
+else:
+    logger.error("Could not login to Garmin Connect, try again later.")
+    scrape_metrics.error("login")
+
+test = 1
+
+
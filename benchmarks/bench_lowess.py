@@ -0,0 +1,91 @@
+"""
+Benchmark fast_lowess against statsmodels on synthetic weight series.
+
+    python benchmarks/bench_lowess.py              # 1k, 10k, 100k points
+    python benchmarks/bench_lowess.py 500 5000     # custom sizes
+
+Needs statsmodels as the reference: pip install -r benchmark_requirements.txt
+
+Every size is first checked for agreement with statsmodels' lowess(it=0);
+statsmodels is quadratic in n, so 100k points take a while on its side. Small
+and tie-heavy series (few days, many readings each) are checked as well.
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from statsmodels.nonparametric.smoothers_lowess import lowess as sm_lowess
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from fast_lowess import _prepare, _tied_means, lowess, lowess_batch
+
+FRAC = 0.3
+SIZES = [1_000, 10_000, 100_000]
+# (points, distinct days, frac): down to the dashboard's few hundred readings
+TIE_CASES = [(50, 50, 0.3), (60, 4, 0.5), (239, 2, 0.9), (350, 6, 0.3), (1_000, 40, 0.3)]
+# Same tolerance the dashboard cares about: far below the 0.01 kg display precision
+ATOL = 1e-6
+# Rows whose weight all sits on one day: statsmodels' clamped variance adds
+# rounding noise there, fast_lowess returns that day's exact mean
+TIED_ATOL = 1e-3
+
+
+def synthetic_series(n, seed=0, days=None):
+    """n weigh-ins as date ordinals (several per day, ties included) and kg."""
+    rng = np.random.default_rng(seed)
+    x = np.sort(rng.integers(0, days or max(n // 3, 1), n)).astype(float) + 739_000
+    y = 85 - 0.02 * (x - x[0]) + rng.normal(0, 0.6, n)
+    return x, y
+
+
+def timed(func, repeat=1):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def check_ties(seed=0):
+    """Small and tie-heavy series: every row against statsmodels, tied-day rows with TIED_ATOL."""
+    print(f"{'n':>8} {'days':>5} {'frac':>5} {'speedup':>8} {'max |diff|':>11} {'tied rows':>10} {'tied |diff|':>12}")
+    for n, days, frac in TIE_CASES:
+        x, y = synthetic_series(n, seed, days)
+        expected, sm_time = timed(lambda: sm_lowess(y, x, frac=frac, it=0), repeat=3)
+        actual, fast_time = timed(lambda: lowess(y, x, frac=frac), repeat=3)
+
+        tied = np.zeros(n, dtype=bool)
+        tied[_tied_means(_prepare(x, y, frac))[0]] = True
+        diff = np.abs(actual - expected).max(axis=1)
+        other, tied_diff = diff[~tied].max(initial=0.0), diff[tied].max(initial=0.0)
+        if other > ATOL or tied_diff > TIED_ATOL:
+            sys.exit(f"❌ n={n}, {days} days, frac={frac}: fast_lowess differs from statsmodels by {diff.max():.2e}")
+        print(f"{n:>8} {days:>5} {frac:>5} {sm_time / fast_time:>7.1f}x {other:>11.1e} {tied.sum():>10} {tied_diff:>12.1e}")
+
+
+def main(sizes):
+    print(f"{'n':>8} {'statsmodels':>12} {'fast_lowess':>12} {'speedup':>8} {'max |diff|':>11}")
+    for n in sizes:
+        x, y = synthetic_series(n)
+        expected, sm_time = timed(lambda: sm_lowess(y, x, frac=FRAC, it=0))
+        actual, fast_time = timed(lambda: lowess(y, x, frac=FRAC), repeat=3)
+
+        diff = np.max(np.abs(actual - expected))
+        if not np.allclose(actual, expected, rtol=0, atol=ATOL):
+            sys.exit(f"❌ n={n}: fast_lowess differs from statsmodels by {diff:.2e}")
+        print(f"{n:>8} {sm_time:>11.3f}s {fast_time:>11.4f}s {sm_time / fast_time:>7.0f}x {diff:>11.1e}")
+
+    # Dashboard shape: many short series smoothed in one batched call
+    series = [synthetic_series(300, seed=i) for i in range(20)]
+    _, loop_time = timed(lambda: [sm_lowess(y, x, frac=FRAC, it=0) for x, y in series], repeat=3)
+    _, batch_time = timed(lambda: lowess_batch(series, frac=FRAC), repeat=3)
+    print(f"\n20 x 300 points: statsmodels loop {loop_time:.4f}s, lowess_batch {batch_time:.4f}s\n")
+    check_ties()
+    print("✅ fast_lowess matches statsmodels")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -0,0 +1,231 @@
+"""
+Benchmark the dashboard's data pipeline stage by stage on synthetic data.
+
+    python benchmarks/bench_pipeline.py                          # 2 users, 3 years, 3 readings/day
+    python benchmarks/bench_pipeline.py --users 10 --years 5 --per-day 4
+    python benchmarks/bench_pipeline.py --compare benchmarks/pipeline_baseline.json
+
+The stages are the pipeline.py functions the dashboard wraps in its caches,
+called directly, so every call is a cache miss. Results go to
+benchmarks/results/pipeline_<commit>.json; pass --compare with the file of an
+earlier commit, or with benchmarks/pipeline_baseline.json (the committed
+reference for the default parameters), to see the change per stage.
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import pipeline
+from daily_series import DailySeries
+from storage import SQLiteStorage
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+# dashboard.py's competition window, which the default --end closes
+GOAL_START_DATE = pd.Timestamp("2025-07-24")
+GOAL_END_DATE = pd.Timestamp("2025-12-25")
+
+
+class SyntheticDoc:
+    """Just enough of a Firestore DocumentSnapshot for the dashboard's converters."""
+
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = True
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+def synthetic_docs(user_no, years, per_day, end):
+    """Raw weight docs for one user: a slow downward trend, daily noise, ~10% days without readings."""
+    rng = np.random.default_rng(user_no)
+    days = pd.date_range(end=end, periods=int(years * 365), freq="D")
+    days = days[rng.random(len(days)) > 0.1]
+
+    base = 70 + 30 * rng.random()
+    trend = base - 0.01 * np.arange(len(days)) + np.cumsum(rng.normal(0, 0.05, len(days)))
+    docs = []
+    for day, level in zip(days, trend):
+        date_str = day.date().isoformat()
+        for reading in range(per_day):
+            docs.append(SyntheticDoc(f"{date_str}_{reading}", {
+                "date": date_str,
+                "weight": round(level + rng.normal(0, 0.4), 2),
+                "bodyFat": round(20 + rng.normal(0, 1), 1),
+                "scraped_at": f"{date_str}T0{reading % 10}:00:00",
+                "source": "garmin",
+            }))
+    return docs
+
+
+def rollup_docs(frame):
+    """The daily rollup docs (one per year) the writers keep for this frame."""
+    docs = []
+    for year, rows in frame.groupby(frame["date"].dt.year):
+        docs.append(SyntheticDoc(f"rollup_{year}", {
+            "year": int(year),
+            "days": rows["date"].dt.dayofyear.tolist(),
+            "weight": rows["weight"].tolist(),
+            "bodyFat": [None if pd.isna(v) else v for v in rows["bodyFat"]],
+        }))
+    return docs
+
+
+def timed(func, repeat):
+    """Run func `repeat` times; returns (last result, {"min_ms", "median_ms"})."""
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        durations.append(time.perf_counter() - started)
+    return result, {
+        "min_ms": round(min(durations) * 1000, 3),
+        "median_ms": round(statistics.median(durations) * 1000, 3),
+    }
+
+
+def run(args):
+    goal_start_date, goal_end_date = GOAL_START_DATE, GOAL_END_DATE
+    end = pd.Timestamp(args.end)
+    users = [f"user{i}" for i in range(args.users)]
+
+    started = time.perf_counter()
+    docs = {user: synthetic_docs(i, args.years, args.per_day, end) for i, user in enumerate(users)}
+    print(f"Generated {sum(map(len, docs.values())):,} docs for {len(users)} users "
+          f"in {time.perf_counter() - started:.1f}s")
+
+    stages = {}
+
+    def stage(name, func):
+        result, stages[name] = timed(func, args.repeat)
+        print(f"{name:<28} {stages[name]['median_ms']:>10.2f} ms (min {stages[name]['min_ms']:.2f})")
+        return result
+
+    records = stage("records_to_frame", lambda: {u: pipeline.records_from_docs(docs[u])[0] for u in users})
+    frames = stage("aggregate_daily", lambda: {
+        u: pipeline.aggregate_daily(records[u]).reset_index(drop=True) for u in users
+    })
+    # Sessions get the shared compact series' read-only view, not the aggregate itself
+    series = stage("daily_series", lambda: {u: DailySeries.from_frame(frames[u]) for u in users})
+    frames = {u: series[u].frame for u in users}
+    rollups = {u: rollup_docs(frames[u]) for u in users}
+    stage("rollup_to_frame", lambda: {u: pipeline.rollup_frame(rollups[u]) for u in users})
+
+    # The same per-day frames from the local SQL backend, aggregated by SQLite
+    local = SQLiteStorage(":memory:")
+    for u in users:
+        local.put_weights(u, [(doc.id, doc.to_dict()) for doc in docs[u]])
+    stage("sqlite_daily_means", lambda: {u: local.daily_means(u, "0000-01-01") for u in users})
+
+    start_weights = {u: float(frames[u]["weight"].iloc[0]) for u in users}
+    stats = stage("participant_stats", lambda: pipeline.compute_participant_stats(
+        frames, start_weights, goal_start_date, goal_end_date
+    ))
+    goals = stage("goal_weights", lambda: {
+        u: pipeline.compute_goal_weights(start_weights[u], goal_start_date, goal_end_date) for u in users
+    })
+
+    # Fitted over each user's whole synthetic history (the dashboard fits the
+    # competition window only), so the cost keeps scaling with --years
+    trends = {}
+    for trend_type, label in (("Linear", "trendline_linear"), ("Smooth (LOWESS)", "trendline_lowess")):
+        trends[trend_type] = stage(label, lambda: {
+            u: pipeline.compute_trendline(frames[u], goal_end_date, trend_type) for u in users
+        })
+
+    rolling = stage("rolling_stats", lambda: {u: pipeline.rolling_frames(frames[u]) for u in users})
+
+    today = end.normalize()
+    windows = [
+        pipeline.to_days(pipeline.window_bounds(time_range, today, goal_start_date, goal_end_date))
+        for time_range in pipeline.TIME_RANGES
+    ]
+    ref = frames[users[0]]
+    ref_days, ref_weights = pipeline.to_days(ref["date"]), ref["weight"].to_numpy(dtype=float)
+    goal_list = [goals[u] for u in users]
+    ranges = stage("aligned_ranges", lambda: pipeline.aligned_ranges(windows, goal_list, ref_days, ref_weights))
+
+    x_min, x_max = pipeline.window_bounds("Competition Timeline", today, goal_start_date, goal_end_date)
+    stage("plot_points", lambda: {u: pipeline.plot_points(frames[u], x_min, x_max) for u in users})
+
+    plotted = [{"id": u, "name": u.title(), "color": "#636EFA"} for u in users]
+    y_ranges = [r.tolist() for r in ranges[pipeline.TIME_RANGES.index("Competition Timeline")]]
+    stage("build_figure", lambda: pipeline.build_figure(
+        True, "Smooth (LOWESS)", 7, x_min, x_max,
+        plotted, frames, goals, trends["Smooth (LOWESS)"], rolling, stats, y_ranges,
+    ))
+
+    return stages
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(result, baseline_path):
+    baseline = json.loads(Path(baseline_path).read_text())
+    print(f"\nvs {baseline['commit']} ({baseline_path}):")
+    if baseline["params"] != result["params"]:
+        print(f"⚠️ Different parameters: {baseline['params']} vs {result['params']}")
+    for name, current in result["stages"].items():
+        old = baseline["stages"].get(name)
+        if old:
+            ratio = current["median_ms"] / old["median_ms"] if old["median_ms"] else float("inf")
+            flag = "⚠️" if ratio > 1.2 else "  "
+            print(f"{flag} {name:<28} {old['median_ms']:>10.2f} -> {current['median_ms']:>10.2f} ms ({ratio:.2f}x)")
+        else:
+            print(f"   {name:<28} {'new':>10} -> {current['median_ms']:>10.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2)
+    parser.add_argument("--years", type=float, default=3)
+    parser.add_argument("--per-day", type=int, default=3, help="readings per day")
+    parser.add_argument("--end", default="2025-12-25", help="last day of the synthetic history")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="JSON file to write (default: benchmarks/results/pipeline_<commit>.json)")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    stages = run(args)
+
+    commit = git_commit()
+    result = {
+        "commit": commit,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "params": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "stages": stages,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"pipeline_{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2) + "\n")
+    print(f"💾 Results written to {output}")
+
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    main()
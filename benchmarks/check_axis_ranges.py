@@ -0,0 +1,120 @@
+"""
+Check pipeline.compute_goal_weights() and aligned_ranges() against the
+per-date pandas code they replaced, for bit-identical output.
+
+    python benchmarks/check_axis_ranges.py
+
+The old functions are copied below as they were before the vectorized engine,
+with the goal end date as a parameter instead of a script global. Every case
+draws random start weights and goal windows for 1-4 users (sometimes one with
+an empty goal curve), a reference frame with gaps and missing weights, and a
+batch of windows that also reach before the goal start and past its end.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pipeline import DAYS_PER_MONTH, MONTHLY_LOSS_RATE, aligned_ranges, compute_goal_weights, to_days
+
+CASES = 300
+WINDOWS_PER_CASE = 12
+
+
+def old_goal_weights(start_weight, start_date, goal_end_date):
+    goal_dates = pd.date_range(start=start_date, end=goal_end_date, freq="D")
+    months = ((goal_dates - start_date) / pd.Timedelta(days=DAYS_PER_MONTH)).astype(float)
+    goal_weights = start_weight * (1 - MONTHLY_LOSS_RATE * months)
+    return goal_dates, goal_weights
+
+
+def old_aligned_ranges(x1, x2, goals, df_ref):
+    if not goals or len(goals[0][0]) == 0:
+        return [None] * len(goals)
+
+    x1, x2 = pd.Timestamp(x1), pd.Timestamp(x2)
+
+    def goal_edges(goal_x, goal_y):
+        goal_ord = np.array([pd.Timestamp(xx).toordinal() for xx in goal_x if not pd.isna(xx)])
+        return np.interp([x1.toordinal(), x2.toordinal()], goal_ord, goal_y)
+
+    y1_start, y1_end = goal_edges(*goals[0])
+    y1_range = y1_start - y1_end
+
+    visible = df_ref[(df_ref["date"] >= x1) & (df_ref["date"] <= x2)] if not df_ref.empty else df_ref
+    if not visible.empty:
+        max_value = visible["weight"].max()
+        min_value = min(visible["weight"].min(), y1_end)
+    else:
+        max_value = max(y1_start, y1_end)
+        min_value = min(y1_start, y1_end)
+
+    margin1 = max_value - y1_start + 1
+    margin2 = y1_end - min_value + 1
+    ranges = [[y1_end - margin2, y1_start + margin1]]
+
+    for goal_x, goal_y in goals[1:]:
+        if len(goal_x) == 0:
+            ranges.append(None)
+            continue
+        y2_start, y2_end = goal_edges(goal_x, goal_y)
+        y2_range = y2_start - y2_end
+        ranges.append([y2_end - y2_range/y1_range * margin2, y2_start + y2_range/y1_range * margin1])
+    return ranges
+
+
+def random_case(rng):
+    """(goal end, start weights and dates per user, reference frame, day windows)."""
+    start = pd.Timestamp("2025-01-01") + pd.Timedelta(days=int(rng.integers(0, 365)))
+    end = start + pd.Timedelta(days=int(rng.integers(20, 300)))
+    users = [
+        # An empty goal curve: the start weight's date lies after the goal end
+        (float(rng.uniform(60, 120)), end + pd.Timedelta(days=1) if k and rng.random() < 0.15 else start)
+        for k in range(int(rng.integers(1, 5)))
+    ]
+
+    days = pd.date_range(start - pd.Timedelta(days=60), end + pd.Timedelta(days=60), freq="D")
+    days = days[rng.random(len(days)) > 0.3]
+    weights = users[0][0] - 0.02 * np.arange(len(days)) + rng.normal(0, 0.5, len(days))
+    weights[rng.random(len(days)) < 0.1] = np.nan
+    df_ref = pd.DataFrame({"date": days, "weight": weights})
+
+    lo, hi = to_days([start - pd.Timedelta(days=90), end + pd.Timedelta(days=90)])
+    windows = np.sort(rng.integers(lo, hi, (WINDOWS_PER_CASE, 2)), axis=1)
+    return end, users, df_ref, windows
+
+
+def main():
+    rng = np.random.default_rng(0)
+    # Windows past the goal end, where both goal lines are flat, divide 0 by 0 in both versions
+    np.seterr(invalid="ignore", divide="ignore")
+    failures = 0
+    for _ in range(CASES):
+        end, users, df_ref, windows = random_case(rng)
+        old_goals = [old_goal_weights(weight, date, end) for weight, date in users]
+        new_goals = [compute_goal_weights(weight, date, end) for weight, date in users]
+
+        for (old_x, old_y), (new_days, new_y) in zip(old_goals, new_goals):
+            if not (np.array_equal(to_days(old_x), new_days) and np.array_equal(np.asarray(old_y), new_y)):
+                failures += 1
+                print(f"❌ goal curve differs for start {old_x[:1]} end {end.date()}")
+
+        ranges = aligned_ranges(windows, new_goals, to_days(df_ref["date"]), df_ref["weight"].to_numpy(dtype=float))
+        for window, new in zip(windows, ranges):
+            x1, x2 = pd.to_datetime(window, unit="D")
+            old = [[np.nan, np.nan] if r is None else r for r in old_aligned_ranges(x1, x2, old_goals, df_ref)]
+            if not np.array_equal(np.asarray(old, dtype=float), new, equal_nan=True):
+                failures += 1
+                print(f"❌ ranges differ for {x1.date()}..{x2.date()}: {old} vs {new.tolist()}")
+
+    if failures:
+        sys.exit(f"❌ {failures} mismatches")
+    print(f"✅ goal curves and aligned_ranges() are bit-identical to the old code "
+          f"on {CASES} cases, {CASES * WINDOWS_PER_CASE} windows")
+
+
+if __name__ == "__main__":
+    main()
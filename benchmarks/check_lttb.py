@@ -0,0 +1,78 @@
+"""
+Check downsample.lttb() against a plain-loop LTTB, index for index.
+
+    python benchmarks/check_lttb.py
+
+The reference is Steinarsson's published algorithm written out point by point
+(bucket means and triangle areas in Python loops), with the bucket edges
+floor(i * (n - 2) / (n_out - 2)) + 1 in exact integer arithmetic. The usual
+code steps them as i * every with a float `every`, which rounds some edges one
+point early (and can leave point n - 2 out of the last bucket); lttb() does not.
+Series are random walks, with and without repeated x values, over a spread of
+lengths and output sizes including the n_out < 3 and n_out >= n edge cases.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from downsample import lttb
+
+SERIES = 400
+
+
+def reference_lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets as published, one point at a time."""
+    n = len(x)
+    if n_out >= n:
+        return list(range(n))
+    if n_out < 3:
+        return [0, n - 1][:max(n_out, 0)]
+
+    def edge(i):
+        return i * (n - 2) // (n_out - 2) + 1
+
+    sampled = [0]
+    a = 0
+    for i in range(n_out - 2):
+        # Mean of the next bucket (the last point for the final bucket)
+        avg_start, avg_end = edge(i + 1), min(edge(i + 2), n)
+        avg_x = sum(x[avg_start:avg_end]) / (avg_end - avg_start)
+        avg_y = sum(y[avg_start:avg_end]) / (avg_end - avg_start)
+
+        max_area, next_a = -1.0, None
+        for j in range(edge(i), edge(i + 1)):
+            area = abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a]))
+            if area > max_area:
+                max_area, next_a = area, j
+        sampled.append(next_a)
+        a = next_a
+    sampled.append(n - 1)
+    return sampled
+
+
+def main():
+    rng = np.random.default_rng(0)
+    failures = 0
+    for case in range(SERIES):
+        n = int(rng.integers(1, 3000))
+        steps = rng.integers(0, 3, n) if case % 2 else rng.integers(1, 4, n)  # odd cases repeat x values
+        x = np.cumsum(steps).astype(float)
+        y = 80 + np.cumsum(rng.normal(0, 0.4, n))
+        for n_out in {0, 1, 2, 3, 4, n // 10, n // 2, n - 1, n, n + 5}:
+            got = lttb(x, y, n_out).tolist()
+            want = reference_lttb(x.tolist(), y.tolist(), n_out)
+            if got != want:
+                failures += 1
+                first = next((k for k, (g, w) in enumerate(zip(got, want)) if g != w), min(len(got), len(want)))
+                print(f"❌ n={n} n_out={n_out}: first difference at output {first}")
+
+    if failures:
+        sys.exit(f"❌ {failures} mismatches")
+    print(f"✅ lttb() matches the reference on {SERIES} series")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Check rolling.rolling_stats() against a brute-force window scan.
+
+    python benchmarks/check_rolling.py
+
+For every day the reference selects the readings on days (d - window, d] and
+takes their plain mean and np.polyfit slope. The slope is NaN with fewer than
+two distinct days, and both are NaN without readings. Series have gaps,
+missing weights, and up to ten years of history, for each of the dashboard's
+window sizes and a few odd ones.
+
+Prefix sums lose digits as the history grows, so the tolerances are those of
+a ten-year history. Short series agree to about 1e-13 kg and 1e-11 kg/day.
+Even the slope bound is 7e-6 kg/week, far below the 0.01 kg the stats show.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pipeline import ROLLING_WINDOWS
+from rolling import prefix_sums, rolling_stats
+
+SERIES = 60
+WINDOWS = (*ROLLING_WINDOWS, 1, 2, 90)
+MAX_DAYS = 3650
+MEAN_ATOL = 1e-10  # kg
+SLOPE_ATOL = 1e-6  # kg/day
+
+
+def brute_force(days, values, window):
+    mean, slope = np.full(len(days), np.nan), np.full(len(days), np.nan)
+    for i, day in enumerate(days):
+        inside = (days > day - window) & (days <= day) & np.isfinite(values)
+        if inside.any():
+            mean[i] = values[inside].mean()
+        if len(np.unique(days[inside])) >= 2:
+            slope[i] = np.polyfit(days[inside].astype(float), values[inside], 1)[0]
+    return mean, slope
+
+
+def main():
+    rng = np.random.default_rng(0)
+    failures, worst_mean, worst_slope = 0, 0.0, 0.0
+    for _ in range(SERIES):
+        n = int(rng.integers(1, MAX_DAYS // 2))
+        days = 20000 + np.cumsum(rng.integers(1, 4, n))
+        values = 80 - 0.01 * (days - days[0]) + rng.normal(0, 0.4, n)
+        values[rng.random(n) < 0.1] = np.nan
+        table = prefix_sums(days, values)
+
+        for window in WINDOWS:
+            mean, slope = rolling_stats(days, None, window, table=table)
+            want_mean, want_slope = brute_force(days, values, window)
+            with np.errstate(invalid="ignore"):
+                worst_mean = max(worst_mean, np.nanmax(np.abs(mean - want_mean), initial=0))
+                worst_slope = max(worst_slope, np.nanmax(np.abs(slope - want_slope), initial=0))
+            if not np.allclose(mean, want_mean, rtol=0, atol=MEAN_ATOL, equal_nan=True):
+                failures += 1
+                print(f"❌ n={n} window={window}: mean off by {np.nanmax(np.abs(mean - want_mean)):.2e}")
+            if not np.allclose(slope, want_slope, rtol=0, atol=SLOPE_ATOL, equal_nan=True):
+                failures += 1
+                print(f"❌ n={n} window={window}: slope off by {np.nanmax(np.abs(slope - want_slope)):.2e}")
+
+    if failures:
+        sys.exit(f"❌ {failures} mismatches")
+    print(f"✅ rolling_stats() matches the brute force on {SERIES} series x {len(WINDOWS)} windows "
+          f"(worst mean {worst_mean:.1e} kg, slope {worst_slope:.1e} kg/day)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Startup import report for dashboard.py (a `python -X importtime` breakdown).
+
+    python benchmarks/startup_report.py            # report + regression check
+    python benchmarks/startup_report.py --update   # accept the current numbers as baseline
+
+Runs the dashboard's module-level imports (including the lazy_import() stand-ins)
+in a fresh interpreter and fails if
+- a module the dashboard defers with lazy_import(), or one listed under
+  "deferred" in the baseline, is imported at startup anyway, or
+- the total import time grew past the baseline by more than the tolerance.
+"""
+
+import ast
+import json
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DASHBOARD = ROOT / "dashboard.py"
+BASELINE = Path(__file__).resolve().parent / "startup_baseline.json"
+RUNS = 3  # best of, import times are noisy
+TOP = 15
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def startup_source():
+    """Module-level imports and lazy_import() assignments of dashboard.py, plus the deferred module names."""
+    tree = ast.parse(DASHBOARD.read_text())
+    statements, deferred = [], set()
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            statements.append(node)
+        elif (
+            isinstance(node, ast.Assign)
+            and isinstance(node.value, ast.Call)
+            and getattr(node.value.func, "id", None) == "lazy_import"
+        ):
+            statements.append(node)
+            deferred.add(node.value.args[0].value)
+    return ast.unparse(ast.Module(body=statements, type_ignores=[])), deferred
+
+
+def import_times(source):
+    """{module: (self µs, cumulative µs, nesting depth)} for one fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", source],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if result.returncode:
+        sys.exit(f"❌ Startup imports failed:\n{result.stderr[-2000:]}")
+
+    times = {}
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            times[module] = (int(self_us), int(cumulative_us), len(indent) // 2)
+    return times
+
+
+def main(update=False):
+    source, deferred = startup_source()
+    interpreter = import_times("pass")  # site, encodings, ...: not the dashboard's doing
+    runs = [import_times(source) for _ in range(RUNS)]
+    times = min(runs, key=lambda t: sum(c for _, c, depth in t.values() if depth == 0))
+    top_level = sorted(
+        (
+            (module, cumulative) for module, (_, cumulative, depth) in times.items()
+            if depth == 0 and module not in interpreter
+        ),
+        key=lambda item: -item[1],
+    )
+    total_ms = sum(cumulative for _, cumulative in top_level) / 1000
+
+    print(f"Startup imports of {DASHBOARD.name}: {total_ms:.0f} ms, {len(times) - len(interpreter)} modules")
+    print(f"{'cumulative':>12}  top-level import")
+    for module, cumulative in top_level[:TOP]:
+        print(f"{cumulative / 1000:>10.1f}ms  {module}")
+
+    baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+    deferred |= set(baseline.get("deferred", []))
+
+    if update:
+        BASELINE.write_text(json.dumps({
+            "total_ms": round(total_ms),
+            "tolerance": baseline.get("tolerance", 1.5),
+            "deferred": sorted(deferred),
+            "top": {module: round(cumulative / 1000, 1) for module, cumulative in top_level[:TOP]},
+        }, indent=2) + "\n")
+        print(f"💾 Baseline written to {BASELINE.name}")
+        return
+
+    eager = sorted(m for m in deferred if m in times)
+    if eager:
+        sys.exit(f"❌ Imported at startup although deferred: {', '.join(eager)}")
+    if baseline:
+        budget = baseline["total_ms"] * baseline["tolerance"]
+        if total_ms > budget:
+            sys.exit(f"❌ Startup imports take {total_ms:.0f} ms, budget {budget:.0f} ms (baseline {baseline['total_ms']} ms)")
+    print("✅ Startup imports within baseline")
+
+
+if __name__ == "__main__":
+    main(update="--update" in sys.argv[1:])
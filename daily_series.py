@@ -0,0 +1,52 @@
+"""
+Compact, read-only per-day series shared by every session.
+
+The per-user state holds one DailySeries per data version: int32 day numbers
+(days since 1970-01-01) and float32 weight and body fat, 12 bytes a day. Its
+DataFrame view is built once when the series is created; its weight and
+bodyFat columns are the arrays themselves, so every session reads the same
+memory instead of getting its own copy, and none of them can write to it.
+Only its date column is extra: datetime64[ns], 8 more bytes, 20 a day in all.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class DailySeries:
+    """One user's per-day means as compact read-only arrays, with a shared DataFrame view."""
+
+    def __init__(self, days, weight, body_fat):
+        self.days = np.asarray(days, dtype=np.int32)
+        self.weight = np.asarray(weight, dtype=np.float32)
+        self.body_fat = np.asarray(body_fat, dtype=np.float32)
+        for values in (self.days, self.weight, self.body_fat):
+            values.flags.writeable = False
+        self.frame = pd.DataFrame({
+            "date": self.days.astype("datetime64[D]").astype("datetime64[ns]"),
+            "weight": self.weight,
+            "bodyFat": self.body_fat,
+        }, copy=False)
+
+    @classmethod
+    def from_frame(cls, frame):
+        """From a per-day frame (date, weight, bodyFat), sorted by date."""
+        if frame.empty:
+            return cls([], [], [])
+        days = frame["date"].to_numpy().astype("datetime64[D]").astype(np.int64)
+        return cls(days, frame["weight"].to_numpy(dtype=float), frame["bodyFat"].to_numpy(dtype=float))
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def nbytes(self):
+        """Arrays plus the frame's date column, the only column they do not share."""
+        return self.days.nbytes + self.weight.nbytes + self.body_fat.nbytes + self.frame["date"].to_numpy().nbytes
+
+    def equals(self, other):
+        return (
+            np.array_equal(self.days, other.days)
+            and np.array_equal(self.weight, other.weight, equal_nan=True)
+            and np.array_equal(self.body_fat, other.body_fat, equal_nan=True)
+        )
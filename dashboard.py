@@ -1,82 +1,629 @@
 import streamlit as st
 import streamlit.components.v1 as components
+from streamlit.errors import StreamlitSecretNotFoundError
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import pandas as pd
-import numpy as np
 import os
-import plotly.graph_objects as go
+from plotly.colors import qualitative
 import datetime
-import firebase_admin
-from google.cloud import firestore
-from google.api_core.exceptions import GoogleAPIError
-from firebase_admin import credentials, firestore
-from scipy.stats import linregress
-from statsmodels.nonparametric.smoothers_lowess import lowess
 import urllib.parse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import json
+from pathlib import Path
+import pyarrow as pa
+from lazy_imports import lazy_import
+from daily_series import DailySeries
+from stage_profiler import StageProfiler
+from storage import StoredDoc, open_storage
+from pipeline import (
+    READ_FIELDS, ROLLING_WINDOWS, TIME_RANGES, WATERMARK_FIELDS, aggregate_daily, axis_ranges, build_figure,
+    compute_goal_weights, compute_participant_stats, compute_trendline, records_from_docs,
+    rolling_frames, rollup_frame, window_bounds,
+)
 
-query_params = st.query_params
-refresh_flag = "refresh" in query_params
-if refresh_flag:
-    st.cache_data.clear()
+# Modules that streamlit does not already pull in load on first use: Firestore
+# (and its gRPC stack) when data is actually fetched, the LOWESS code (pipeline.py)
+# when that trend is drawn. benchmarks/startup_report.py fails if one creeps back
+# into startup.
+api_exceptions = lazy_import("google.api_core.exceptions")
+firestore_sync = lazy_import("firestore_sync")
 
-# Firebase init
-if not firebase_admin._apps:
-    print("☁️ Running in Streamlit Cloud. Loading st.secrets['firebase']")
-    try:
-        firebase_secret = st.secrets["firebase"]
-        cred_dict = {k: v.replace("\\n", "\n") if k == "private_key" else v for k, v in firebase_secret.items()}
-        cred = credentials.Certificate(cred_dict)
-    except Exception as e:
-        st.error(f"❌ Failed to load secrets: {e}")
-        raise
 
-    firebase_admin.initialize_app(cred)
+def get_db():
+    """
+    Firestore client, created (and Firebase initialized) on first use.
+    firebase_admin keeps the app and its client per process, so this is cheap
+    after the first call and safe to call from the loader threads.
+    """
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    if not firebase_admin._apps:
+        print("☁️ Running in Streamlit Cloud. Loading st.secrets['firebase']")
+        try:
+            firebase_secret = st.secrets["firebase"]
+            cred_dict = {k: v.replace("\\n", "\n") if k == "private_key" else v for k, v in firebase_secret.items()}
+            cred = credentials.Certificate(cred_dict)
+        except Exception as e:
+            st.error(f"❌ Failed to load secrets: {e}")
+            raise
+
+        try:
+            firebase_admin.initialize_app(cred)
+        except ValueError:
+            pass  # another loader thread initialized it first
 
-db = firestore.client()
+    return firestore.client()
+
+
+@st.cache_resource
+def get_storage():
+    """The STORAGE_BACKEND (storage.py) shared by all sessions: Firestore by default, or a local SQLite file."""
+    return open_storage(get_db)
 
 # --- Load Data from Firestore ---
 
-@st.cache_data(ttl=1800)  # cache for 1/2 hour
-def load_data(user):
+LOAD_TTL_SECONDS = 1800  # check for new docs every 1/2 hour
+# Raw docs are re-read in full once a day, in case a delta read missed a
+# change (a deleted doc, or one written without a stamp by an older writer)
+RECONCILE_SECONDS = 24 * 3600
+
+# Firestore listeners push new docs into the shared state as they are written,
+# and open pages rerun within LIVE_CHECK_SECONDS once their users' data
+# changed. LIVE_UPDATES=0 falls back to the load TTL and the scrapers' ping.
+LIVE_UPDATES = os.getenv("LIVE_UPDATES", "1") != "0"
+LIVE_CHECK_SECONDS = 5
+
+# On-disk Arrow snapshot of each user's raw records, so a cold start renders
+# from disk and reconciles with Firestore in the background.
+SNAPSHOT_DIR = Path(os.getenv("SNAPSHOT_DIR", Path(__file__).parent / ".snapshots"))
+MAX_LOAD_WORKERS = 16
+
+
+@st.cache_resource
+def _weight_store():
+    """Process-wide per-user load state shared by all sessions."""
+    return {"lock": threading.Lock(), "users": {}}
+
+
+def _user_state(user):
+    store = _weight_store()
+    with store["lock"]:
+        if user not in store["users"]:
+            store["users"][user] = {
+                "lock": threading.Lock(),
+                "records": None,  # raw docs indexed by doc id (date, weight, bodyFat)
+                "since": None,  # earliest ISO date the records cover
+                "source": "docs",  # "rollup" once loaded from the daily rollup docs, "query" from a SQL backend
+                "rollup_seen": {},  # rollup year -> updated_at last loaded
+                "marks": dict.fromkeys(WATERMARK_FIELDS),  # field -> UTC Timestamp, None before the first stamp
+                "reconciled_at": 0.0,  # last full read of the raw docs
+                "series": DailySeries([], [], []),  # per-day aggregate, compact and read-only (daily_series.py)
+                "loaded_at": 0.0,
+                "refreshing": False,
+                "version": 0,  # bumped whenever the frame changes
+                "last_token": None,  # last refresh token received for this user
+                "nearest": {},  # (ISO date, version) -> mean weight of the closest day
+                "watches": [],  # live Firestore listeners on the user's data
+                "watch_source": None,  # the source they were started for
+            }
+        return store["users"][user]
+
+
+def invalidate_user_data(user=None, token=None):
+    """Mark one user's data (or everyone's) stale.
+
+    The next load_data() call keeps serving the current frame and reloads in
+    the background. A repeated token (e.g. the same ?v= on every rerun of a
+    pinged session) is ignored.
+    """
+    store = _weight_store()
+    with store["lock"]:
+        if user is None:
+            states = list(store["users"].values())
+        else:
+            states = [store["users"][user]] if user in store["users"] else []
+    for state in states:
+        if token is not None and token == state["last_token"]:
+            continue
+        state["last_token"] = token
+        state["loaded_at"] = 0.0
+
+
+def _latest_marks(user):
+    """Current high-water marks, as UTC Timestamps."""
+    with profiler.stage("storage_marks", user=user):
+        marks = storage.latest_marks(user, WATERMARK_FIELDS)
+    return {field: None if mark is None else pd.Timestamp(mark).tz_convert("UTC") for field, mark in marks.items()}
+
+
+def _stream_range(user, since, until=None):
+    """The docs dated since <= date < until, reading only READ_FIELDS."""
+    with profiler.stage("storage_range", user=user) as stage:
+        docs = storage.weight_docs(user, READ_FIELDS, since, until)
+        stage["docs"] = len(docs)
+    return docs
+
+
+def _stream_new_docs(user, marks):
+    """Only the docs written after the marks, whatever their date."""
+    with profiler.stage("storage_delta", user=user) as stage:
+        docs = storage.new_weight_docs(user, READ_FIELDS, marks)
+        stage["docs"] = len(docs)
+    return docs
+
+
+def _nearest_in_frame(state, day):
+    """
+    (True, weight) of the day closest to `day` if the loaded frame settles it,
+    else (False, None): a day before the loaded range might be closer.
+    """
+    frame = state["series"].frame
+    if frame.empty or state["since"] is None:
+        return False, None
+    dates = frame["date"]
+    before, after = dates[dates <= day], dates[dates >= day]
+    candidates = ([before.iloc[-1]] if not before.empty else []) + ([after.iloc[0]] if not after.empty else [])
+    if not candidates:
+        return False, None
+    nearest = min(candidates, key=lambda d: (abs((d - day).days), d))
+    if before.empty and (day - pd.Timestamp(state["since"])).days + 1 <= abs((nearest - day).days):
+        return False, None
+    weight = frame.loc[dates == nearest, "weight"].iloc[0]
+    return True, None if pd.isna(weight) else float(weight)
+
+
+def _nearest_day_weight(user, day):
+    """
+    Mean weight of the day with readings closest to `day` (earlier day on a
+    tie): from the loaded frame when it covers that, else from storage.
+    Cached per data version, so it is not re-queried on every rerun.
+    """
+    state = _user_state(user)
+    day_str = day.date().isoformat()
+    key = (day_str, state["version"])
+    if key in state["nearest"]:
+        return state["nearest"][key]
+
+    known, weight = _nearest_in_frame(state, day)
+    if not known:
+        with profiler.stage("storage_start_weight", user=user):
+            weight = storage.nearest_day_weight(user, day_str)
+
+    state["nearest"] = {key: weight}
+    return weight
+
+
+def _merge_docs(state, docs, since, marks=None):
+    """Upsert docs into the raw records and re-aggregate only the days they touch.
+
+    Everything is built off to the side and swapped in at the end, so readers
+    never see a half-merged frame.
+    """
+    with profiler.stage("aggregate", docs=len(docs)):
+        _merge_records(state, docs, since, marks)
+
+
+def _merge_records(state, docs, since, marks):
+    new, latest = records_from_docs(docs)
+
+    marks = dict(marks or state["marks"])
+    for field, value in latest.items():
+        if marks[field] is None or value > marks[field]:
+            marks[field] = value
+
+    records = state["records"]
+    touched = set(new["date"])
+
+    if records is None:
+        records = new
+    else:
+        replaced = records.index.intersection(new.index)
+        touched |= set(records.loc[replaced, "date"])
+        records = pd.concat([records.drop(replaced), new])
+
+    frame = state["series"].frame if state["records"] is not None else pd.DataFrame()
+    day_rows = aggregate_daily(records[records["date"].isin(touched)])
+    if not frame.empty:
+        day_rows = pd.concat([frame[~frame["date"].isin(touched)], day_rows])
+
+    state["records"] = records
+    state["since"] = since
+    state["marks"] = marks
+    _publish(state, day_rows.sort_values("date"))
+
+
+def _publish(state, frame):
+    """Swap in a new per-day frame, as a compact series all sessions share, and bump the version if it changed."""
+    series = DailySeries.from_frame(frame)
+    if not series.equals(state["series"]):
+        state["series"] = series
+        state["version"] += 1
+
+
+def _refresh_from_rollup(user, state, since):
+    """
+    Load the user's daily means from the rollup docs the scrapers maintain:
+    one index read plus only the years that changed since the last load.
+    Returns False if the user has no complete rollup.
+    """
+    with profiler.stage("storage_rollup_index", user=user, docs=1):
+        info = storage.rollup_index(user)
+    if not info.get("complete"):
+        return False
+
+    was_rollup = state["source"] == "rollup"
+    seen = state["rollup_seen"] if was_rollup else {}
+    years = {year: updated for year, updated in info.get("updated", {}).items() if year >= since[:4]}
+    changed = [year for year, updated in years.items() if seen.get(year) != updated]
+    if was_rollup and not changed:
+        state["since"] = min(since, state["since"])
+        return True
+
+    with profiler.stage("storage_rollup", user=user, docs=len(changed)):
+        rollup_docs = storage.rollup_docs(user, changed)
+    with profiler.stage("aggregate", user=user, docs=len(rollup_docs)):
+        frame = rollup_frame(rollup_docs)
+    if was_rollup:
+        previous = state["series"].frame
+        kept = previous[~previous["date"].dt.year.astype(str).isin(changed)]
+        frame = pd.concat([kept, frame], ignore_index=True)
+        since = min(since, state["since"])
+    frame = frame.sort_values("date").reset_index(drop=True)
+
+    state["records"] = frame.set_index(frame["date"].dt.strftime("%Y-%m-%d").rename("id"))
+    state["since"] = since
+    state["source"] = "rollup"
+    state["rollup_seen"] = {**seen, **{year: years[year] for year in changed}}
+    _publish(state, frame)
+    return True
+
+
+def _refresh_from_query(user, state, since):
+    """Let a SQL backend aggregate: one GROUP BY query returns the per-day frame since `since`."""
+    with profiler.stage("storage_daily_means", user=user) as stage:
+        frame = storage.daily_means(user, since)
+        stage["rows"] = len(frame)
+
+    series = DailySeries.from_frame(frame)
+    if state["source"] != "query" or not series.equals(state["series"]):
+        state["series"] = series
+        state["version"] += 1
+    state["since"] = since
+    state["source"] = "query"
+
+
+def _snapshot_path(user):
+    return SNAPSHOT_DIR / f"{user}.arrow"
+
+
+def _write_snapshot(user, state):
+    """Atomically write the user's raw records and marks as an Arrow IPC file."""
+    table = pa.Table.from_pandas(state["records"].rename_axis("id").reset_index(), preserve_index=False)
+    table = table.replace_schema_metadata({
+        "marks": json.dumps({field: None if mark is None else mark.isoformat() for field, mark in state["marks"].items()}),
+        "reconciled_at": str(state["reconciled_at"]),
+        "since": state["since"],
+        "source": state["source"],
+        "rollup_seen": json.dumps(state["rollup_seen"]),
+    })
+
+    path = _snapshot_path(user)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with pa.OSFile(str(tmp_path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def _read_snapshot(user, state):
+    """Seed the state from the memory-mapped snapshot. Returns False if there is none."""
+    path = _snapshot_path(user)
+    if not path.exists():
+        return False
+
+    # The table's buffers keep the mapping open, so the source is not closed here
+    with profiler.stage("snapshot_read", user=user) as stage:
+        table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+        stage["rows"] = table.num_rows
+    marks = json.loads(table.schema.metadata.get(b"marks", b"{}"))
+    metadata = table.schema.metadata
+    records = table.to_pandas().set_index("id")
+
+    state["since"] = metadata.get(b"since", b"").decode()
+    state["source"] = metadata.get(b"source", b"docs").decode()
+    state["rollup_seen"] = json.loads(metadata.get(b"rollup_seen", b"{}"))
+    state["marks"] = {**state["marks"], **{k: pd.Timestamp(v) if v else None for k, v in marks.items() if k in state["marks"]}}
+    # Snapshots from before the reconcile was recorded get one on the first refresh
+    state["reconciled_at"] = float(metadata.get(b"reconciled_at", b"0"))
+    state["records"] = records
+    with profiler.stage("aggregate", user=user, rows=len(records)):
+        _publish(state, aggregate_daily(records))
+    return True
+
+
+def _reconcile_due(state):
+    return state["source"] == "docs" and time.time() - state["reconciled_at"] >= RECONCILE_SECONDS
+
+
+def _refresh_from_docs(user, state, since):
+    if state["records"] is None or _reconcile_due(state):
+        # A full read, replacing the records: the first load, or the daily
+        # reconcile. Marks first, so nothing written during the range read is
+        # skipped later
+        since = min(since, state["since"] or since)
+        marks = _latest_marks(user)
+        docs = _stream_range(user, since)
+        state["records"] = None
+        _merge_docs(state, docs, since, marks)
+        state["reconciled_at"] = time.time()
+    else:
+        docs = _stream_new_docs(user, state["marks"])
+        if since < state["since"]:
+            docs += _stream_range(user, since, until=state["since"])
+        since = min(since, state["since"])
+        if docs or since != state["since"]:
+            _merge_docs(state, docs, since)
+
+
+def _refresh(user, state, since):
+    """
+    Pull new data into the state, extend it back to `since` (ISO date) if it
+    does not reach that far yet, and persist the snapshot. Caller holds the lock.
+    """
+    version = state["version"]
+    if storage.aggregates:
+        _refresh_from_query(user, state, since)
+    elif not _refresh_from_rollup(user, state, since):
+        if state["source"] == "rollup":
+            # The rollup was reset; start over from the raw docs
+            state["records"] = None
+            state["source"] = "docs"
+        _refresh_from_docs(user, state, since)
+
+    if state["version"] != version:
+        _save_snapshot(user, state)
+    state["loaded_at"] = time.time()
+    _watch(user, state)
+
+
+def _listening(state):
+    return bool(state["watches"]) and all(watch.is_active for watch in state["watches"])
+
+
+def _watch(user, state):
+    """
+    Keep live listeners on the user's data (caller holds the lock): on the raw
+    docs written past the marks, or on the rollup index. They are restarted
+    when one dropped or the state switched source.
+    """
+    if not (LIVE_UPDATES and storage.live):
+        return
+    if _listening(state) and state["watch_source"] == state["source"]:
+        return
+    _unwatch(state)
+
+    def on_docs(docs):
+        try:
+            with state["lock"]:
+                _merge_docs(state, docs, state["since"])
+                _save_snapshot(user, state)
+        except Exception as e:
+            print(f"⚠️ Live update failed for '{user}': {e}")
+
+    def on_rollup(index):
+        try:
+            with state["lock"]:
+                _refresh(user, state, state["since"])
+        except Exception as e:
+            print(f"⚠️ Live update failed for '{user}': {e}")
+
     try:
-        docs = db.collection("users").document(user).collection("weight_data").stream()
-        records = [doc.to_dict() for doc in docs]
-        df = pd.DataFrame(records)
+        if state["source"] == "rollup":
+            state["watches"] = storage.watch_rollup_index(user, on_rollup)
+        else:
+            state["watches"] = storage.watch_new_weight_docs(user, state["marks"], on_docs)
+        state["watch_source"] = state["source"]
+    except Exception as e:
+        print(f"⚠️ Starting live updates failed for '{user}': {e}")
 
-        if not df.empty and "date" in df.columns:
-            df["date"] = pd.to_datetime(df["date"])
-            df = df.groupby("date").agg({
-                "weight": "mean",
-                "bodyFat": "mean"
-            }).reset_index().sort_values("date")
 
-        #st.success(f"✅ Loaded {len(df)} entries for '{user}'.")
-        return df
+def _unwatch(state):
+    watches, state["watches"] = state["watches"], []
+    if watches:
+        # Off this thread: closing a listener waits for its callback, which
+        # may be waiting for the lock the caller holds
+        threading.Thread(target=lambda: [watch.unsubscribe() for watch in watches], daemon=True).start()
 
-    except GoogleAPIError as e:
-        st.error(f"❌ Firestore error for '{user}': {e}")
-        return pd.DataFrame()
 
+def _save_snapshot(user, state):
+    # A local SQL backend is already on disk; the snapshot is for Firestore
+    if storage.aggregates:
+        return
+    try:
+        with profiler.stage("snapshot_write", user=user):
+            _write_snapshot(user, state)
     except Exception as e:
-        st.error(f"❌ Unexpected error for '{user}': {e}")
-        return pd.DataFrame()
+        print(f"⚠️ Snapshot write failed for '{user}': {e}")
+
+
+def add_reading(user, doc_id, data):
+    """
+    Write one reading through: persist it, then apply it to the shared state
+    so every session's next rerun plots it without reloading the user. Raw
+    docs are merged in place (no reads); rollup and SQL state re-sync the
+    user (on Firestore the rollup index plus the changed year).
+    """
+    storage.put_weights(user, [(doc_id, data)])
+
+    state = _user_state(user)
+    with state["lock"]:
+        if state["since"] is None or data["date"] < state["since"]:
+            return  # Not loaded that far back; the load that gets there reads it
+
+        if state["source"] == "docs":
+            # Without its watermark fields, so the marks do not move past
+            # docs other writers added since the last load
+            _merge_docs(state, [StoredDoc(doc_id, {field: data.get(field) for field in READ_FIELDS})], state["since"])
+            _save_snapshot(user, state)
+        else:
+            _refresh(user, state, state["since"])
 
 
+def _refresh_in_background(user, state):
+    if state["refreshing"]:
+        return
+    state["refreshing"] = True
 
-# Load user data
-df_kevin = load_data("kevin")
+    def run():
+        try:
+            with state["lock"]:
+                _refresh(user, state, state["since"])
+        except Exception as e:
+            print(f"⚠️ Background reload failed for '{user}': {e}")
+        finally:
+            state["refreshing"] = False
 
-# Load Simon's data and average it per day
-df_simon_raw = load_data("simon")
-simon_available = not df_simon_raw.empty
+    threading.Thread(target=run, name=f"reload-{user}", daemon=True).start()
+
+
+def _covers(state, since):
+    return state["since"] is not None and state["since"] <= since
 
-if simon_available:
-    df_simon = (
-        df_simon_raw.groupby("date", as_index=False)
-        .agg({"weight": "mean", "bodyFat": "mean"})
-        .sort_values("date")
-    )
-else:
-    df_simon = pd.DataFrame()
+
+def _current(state):
+    # Writers swap the series in before bumping the version, so reading the
+    # version first never pairs a new version with an old frame. The frame is
+    # the series' shared read-only view: no per-session copy.
+    version = state["version"]
+    return state["series"].frame, version
+
+
+def _load_user(user, since):
+    """Return (frame, data version, error message or None) for one user, covering dates >= `since`.
+
+    Makes no Streamlit calls, so it can run on a worker thread.
+    """
+    state = _user_state(user)
+    if state["refreshing"] and _covers(state, since):
+        # Stale-while-revalidate: a background reload is running, serve what we have
+        return (*_current(state), None)
+
+    error = None
+    with state["lock"]:
+        if state["records"] is None and not storage.aggregates:
+            try:
+                _read_snapshot(user, state)
+            except Exception as e:
+                print(f"⚠️ Snapshot read failed for '{user}': {e}")
+
+        if state["watches"]:
+            # Listeners keep the state current; if one dropped, catch up on
+            # what it missed (the reload listens again)
+            stale = not _listening(state) or _reconcile_due(state)
+        else:
+            stale = time.time() - state["loaded_at"] >= LOAD_TTL_SECONDS
+        if stale and _covers(state, since):
+            # Render the stale frame (or the cold-start snapshot) straight
+            # away; the reload swaps the new frame in when it is done
+            profiler.note(background_reload=True)
+            _refresh_in_background(user, state)
+        elif not _covers(state, since):
+            profiler.note(cache="miss")
+            try:
+                _refresh(user, state, since)
+
+            except api_exceptions.GoogleAPIError as e:
+                error = f"❌ Firestore error for '{user}': {e}"
+
+            except Exception as e:
+                error = f"❌ Unexpected error for '{user}': {e}"
+
+        return (*_current(state), error)
+
+
+def load_data(user, since):
+    df, _, error = _load_user(user, since)
+    if error:
+        st.error(error)
+    return df
+
+
+def _load_participant(user, since, start_date, lookup_start_weight):
+    # "hit": served from the in-memory frame (possibly with a background reload)
+    with profiler.stage("load", user=user, cache="hit"):
+        df, version, error = _load_user(user, since)
+    start_weight = None
+    if lookup_start_weight and error is None:
+        try:
+            start_weight = _nearest_day_weight(user, start_date)
+        except Exception as e:
+            error = f"❌ Start weight lookup failed for '{user}': {e}"
+    return df, version, start_weight, error
+
+
+def load_all_data(participants, since, start_date):
+    """
+    Load every participant concurrently (page latency follows the slowest load,
+    not the sum) and look up the start weight of those without a configured one.
+    Returns ({user: frame}, {user: data version}, {user: start weight}).
+    """
+    ctx = get_script_run_ctx()
+
+    def init_worker():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        profiler.attach()
+
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(MAX_LOAD_WORKERS, len(participants))), initializer=init_worker,
+    ) as pool:
+        results = list(pool.map(
+            lambda p: _load_participant(p["id"], since, start_date, p.get("start_weight") is None),
+            participants,
+        ))
+
+    frames, versions, start_weights = {}, {}, {}
+    for p, (df, version, start_weight, error) in zip(participants, results):
+        if error:
+            st.error(error)
+        frames[p["id"]] = df
+        versions[p["id"]] = version
+        start_weights[p["id"]] = start_weight if p.get("start_weight") is None else p["start_weight"]
+    return frames, versions, start_weights
+
+
+query_params = st.query_params
+refresh_flag = "refresh" in query_params
+# ?profile=1 times every stage of this rerun (Firestore reads, aggregation,
+# trends, figure, chart payload), logs each as a JSON line and shows them in a
+# debug panel at the bottom of the page
+profiler = StageProfiler("profile" in query_params)
+storage = get_storage()
+if refresh_flag:
+    # ?refresh=1&user=<id>&v=<token> targets one user; a bare ?refresh=1 hits
+    # everyone. Users with live listeners are current already and ignore it.
+    invalidate_user_data(query_params.get("user"), query_params.get("v"))
+
+
+
+# --- Participants ---
+# Override with a [[participants]] array in secrets.toml. "start_weight" is
+# optional: without it the reading closest to goal_start_date is used.
+DEFAULT_PARTICIPANTS = [
+    {"id": "kevin", "name": "Kevin", "color": "#636EFA", "start_weight": 78},
+    {"id": "simon", "name": "Simon", "color": "green", "manual_entry": True},
+]
+
+try:
+    participants = [dict(p) for p in st.secrets.get("participants", DEFAULT_PARTICIPANTS)]
+except StreamlitSecretNotFoundError:
+    # No secrets.toml at all (local runs on SQLite)
+    participants = [dict(p) for p in DEFAULT_PARTICIPANTS]
+for i, p in enumerate(participants):
+    p.setdefault("name", p["id"].title())
+    p.setdefault("color", qualitative.Plotly[i % len(qualitative.Plotly)])
 
 
 
@@ -87,8 +634,6 @@ st.set_page_config(page_title="Fat Boy Slim Competition", layout="wide")
 st.title("Fat Boy Slim Competition")
 
 # --- Detect Mobile Device and Adjust Default Range ---
-import streamlit.components.v1 as components
-
 if "device_checked" not in st.session_state:
     components.html(
         """
@@ -111,328 +656,148 @@ if "show_trendlines" not in st.session_state:
     st.session_state["show_trendlines"] = True
 if "trend_type" not in st.session_state:
     st.session_state["trend_type"] = "Smooth (LOWESS)"
+if "rolling_window" not in st.session_state:
+    st.session_state["rolling_window"] = 0  # days, 0 = no rolling average trace
 
 # Use session state values throughout the script
 time_range = st.session_state["time_range"]
 show_trendlines = st.session_state["show_trendlines"]
 trend_type = st.session_state["trend_type"]
+rolling_window = st.session_state["rolling_window"]
 
 
 # --- Constants ---
-kevin_start_weight = 78
 goal_start_date = datetime.datetime(2025, 7, 24)
 goal_end_date = datetime.datetime(2025, 12, 25)
 
 # Convert to pandas.Timestamp and normalize
 goal_start_date = pd.to_datetime(goal_start_date).normalize()
 goal_end_date = pd.to_datetime(goal_end_date).normalize()
-kevin_range_padding = 1
 
-# Default fallback if no data is available
-simon_start_weight = None
 
-if not df_simon.empty:
-    # Find the entry closest to the defined start date
-    df_simon["days_diff"] = (df_simon["date"] - goal_start_date).abs()
-    closest_row = df_simon.loc[df_simon["days_diff"].idxmin()]
-    simon_start_weight = closest_row["weight"]
+# --- X-axis window for the selected time range ---
+today = pd.Timestamp.today()
+x_min, x_max = window_bounds(time_range, today, goal_start_date, goal_end_date)
 
-# --- Goal Computation ---
-def compute_goal_weights(start_weight, start_date):
-    goal_dates = pd.date_range(start=start_date, end=goal_end_date, freq="D")
-    months = ((goal_dates - start_date) / pd.Timedelta(days=30.437)).astype(float)
-    goal_weights = start_weight * (1 - 0.015 * months)
-    return goal_dates, goal_weights
 
-kevin_start_date = goal_start_date
-goal_dates_kevin, kevin_goal_weights = compute_goal_weights(kevin_start_weight, kevin_start_date)
-kevin_goal_weight = kevin_goal_weights[-1]
+# Load all users' data in parallel. Firestore is only asked for the visible
+# window plus the competition timeline the trend and goal lines are built on.
+since = min(x_min, goal_start_date).date().isoformat()
+with profiler.stage("load_all", users=len(participants)):
+    frames, versions, start_weights = load_all_data(participants, since, goal_start_date)
 
-if simon_available and simon_start_weight is not None:
-    simon_start_date = goal_start_date
-    goal_dates_simon, simon_goal_weights = compute_goal_weights(simon_start_weight, simon_start_date)
-    simon_goal_weight = simon_goal_weights[-1]
 
-try:
-    if simon_goal_weights is not None and len(simon_goal_weights) > 0:
-        simon_goals = simon_goal_weights
-    else:
-        simon_goals = None
-except NameError:
-    simon_goals = None
+# --- Stats: one vectorized pass over all users ---
+with profiler.stage("stats"):
+    stats = compute_participant_stats(frames, start_weights, goal_start_date, goal_end_date)
 
+# Participants with a known start weight get a goal curve and a y-axis
+plotted = [p for p in participants if pd.notna(stats.loc[p["id"], "start_weight"])]
 
-# --- Filter to competition timeline for Trendline---
-df_kevin_comp = df_kevin[(df_kevin["date"] >= goal_start_date) & (df_kevin["date"] <= goal_end_date)]
-df_simon_comp = df_simon[(df_simon["date"] >= goal_start_date) & (df_simon["date"] <= goal_end_date)] if simon_available else pd.DataFrame()
+# --- Goal Computation ---
+# Goal curves are computed once per start weight and cached.
+GOAL_CACHE_ENTRIES = 64
 
 
-# --- Compute Linear Trendline for Kevin ---
-def compute_trendline(df, goal_end_date, trend_type="Smooth (LOWESS)"):
-    if df.empty:
-        return [], []
+@st.cache_data(max_entries=GOAL_CACHE_ENTRIES)
+def cached_goal_weights(start_weight, start_date, end_date):
+    """compute_goal_weights(), memoized per start weight and goal window."""
+    profiler.note(cache="miss")
+    return compute_goal_weights(start_weight, start_date, end_date)
 
-    x = df["date"].map(datetime.datetime.toordinal).to_numpy()
-    y = df["weight"].to_numpy()
+goals = {}
+for p in plotted:
+    with profiler.stage("goal", user=p["id"], cache="hit"):
+        goals[p["id"]] = cached_goal_weights(float(stats.loc[p["id"], "start_weight"]), goal_start_date, goal_end_date)
 
-    mask = (
-        ~np.isnan(x) & ~np.isnan(y) &
-        np.isfinite(x) & np.isfinite(y)
-    )
-    x = x[mask]
-    y = y[mask]
 
-    if len(x) < 3:
-        return [], []
+# --- Compute Trendlines on the competition timeline ---
+TREND_CACHE_ENTRIES = 256
 
-    try:
-        if trend_type == "Linear":
-            coeffs = np.polyfit(x, y, deg=1)
-            m, b = coeffs
-            end_x = goal_end_date.toordinal()
-            trend_x = np.array([x[0], end_x])
-            trend_y = m * trend_x + b
-            trend_x_dates = [datetime.date.fromordinal(int(d)) for d in trend_x]
-            return trend_x_dates, trend_y
-        else:
-            # LOWESS smoothing
-            smoothed = lowess(y, x, frac=0.3, it=0)
-            last_x, last_y = smoothed[-2:, 0], smoothed[-2:, 1]
-            local_slope = (last_y[1] - last_y[0]) / (last_x[1] - last_x[0])
-            end_x = goal_end_date.toordinal()
-            extend_x = np.linspace(smoothed[-1, 0], end_x, 30)
-            extend_y = smoothed[-1, 1] + local_slope * (extend_x - smoothed[-1, 0])
-            full_x = np.concatenate([smoothed[:, 0], extend_x])
-            full_y = np.concatenate([smoothed[:, 1], extend_y])
-            trend_x = [datetime.date.fromordinal(int(xx)) for xx in full_x]
-            trend_y = full_y
-            return trend_x, trend_y
-    except Exception as e:
-        print(f"⚠️ Trendline error: {e}")
-        return [], []
-
-kevin_trend_x, kevin_trend_y = compute_trendline(df_kevin_comp, goal_end_date, trend_type)
-simon_trend_x, simon_trend_y = compute_trendline(df_simon_comp, goal_end_date, trend_type)
-
-# --- Plot ---
-fig = go.Figure()
-
-fig.add_trace(go.Scatter(
-    x=df_kevin["date"], y=df_kevin["weight"],
-    mode="lines+markers", name="Kevin", yaxis="y1", connectgaps=True, showlegend=True
-))
-
-fig.add_trace(go.Scatter(
-    x=goal_dates_kevin, y=kevin_goal_weights,
-    mode="lines", name="Goal Trendline",
-    line=dict(dash="dot", color="gray"),
-    yaxis="y1",
-    showlegend=False
-))
-
-
-if simon_available:
-    fig.add_trace(go.Scatter(
-        x=df_simon["date"], y=df_simon["weight"],
-        mode="lines+markers", name="Simon", yaxis="y2", line=dict(color="green"), connectgaps=True, showlegend=True
-    ))
-
-    # Simon goal trendline — do NOT include in legend
-    fig.add_trace(go.Scatter(
-        x=goal_dates_simon, y=simon_goals,
-        mode="lines",
-        line=dict(dash="dot", color="gray"),
-        yaxis="y2",
-        showlegend=False  # hide from legend
-    ))
-
-# Add Kevin linear trendline
-if show_trendlines and len(kevin_trend_x) > 0:
-    fig.add_trace(go.Scatter(
-        x=kevin_trend_x, y=kevin_trend_y,
-        mode="lines",
-        line=dict(dash="dot", color="blue"),
-        name="Kevin Linear Trend",
-        yaxis="y1",
-        showlegend=False
-    ))
-    
-# Add Kevin goal line
-kevin_goal_line = np.full_like(kevin_trend_x, kevin_goal_weight)
-
-fig.add_trace(go.Scatter(
-        x=kevin_trend_x, y=kevin_goal_line,
-        mode="lines",
-        line=dict(dash="dot", color="red"),
-        name="Kevin Goal Trend",
-        yaxis="y1",
-        showlegend=False
-    ))
-
-# Add Simon linear trendline
-if show_trendlines and simon_available and len(simon_trend_x) > 0:
-    fig.add_trace(go.Scatter(
-        x=simon_trend_x, y=simon_trend_y,
-        mode="lines",
-        line=dict(dash="dot", color="green"),
-        name="Simon Linear Trend",
-        yaxis="y2",
-        showlegend=False
-    ))
-
-
-# Add Simon goal line
-simon_goal_line = np.full_like(simon_trend_x, simon_goal_weight)
-
-fig.add_trace(go.Scatter(
-        x=simon_trend_x, y=simon_goal_line,
-        mode="lines",
-        line=dict(dash="dot", color="red"),
-        name="Simon Goal Trend",
-        yaxis="y1",
-        showlegend=False
-    ))
-
-# --- Utility: Aligned Axis Ranges ---
-def aligned_ranges_from_goals(x1, x2, goal1_x, goal1_y, goal2_x, goal2_y, df_kevin, df_simon):
+
+@st.cache_data(max_entries=TREND_CACHE_ENTRIES)
+def cached_trendline(user, version, trend_type, goal_start_date, goal_end_date, _df):
     """
-    Compute y-axis ranges so Kevin’s and Simon’s goal lines align perfectly
-    between x1 and x2, with proportional scaling and margin.
+    compute_trendline() on the competition timeline, memoized per user, data
+    version, trend type and goal window, so widget reruns skip the fit. The
+    frame itself is not hashed; the version stands in for it.
     """
-    # Validate inputs
-    if len(goal1_x) == 0 or len(goal2_x) == 0:
-        print("⚠️ Empty goal arrays — cannot compute alignment.")
-        return None, None
-
-    # Ensure timestamps
-    x1, x2 = pd.Timestamp(x1), pd.Timestamp(x2)
-
-    # Convert goal x-values safely to ordinal form (skip NaT)
-    goal1_ord = np.array([pd.Timestamp(xx).toordinal() for xx in goal1_x if not pd.isna(xx)])
-    goal2_ord = np.array([pd.Timestamp(xx).toordinal() for xx in goal2_x if not pd.isna(xx)])
-
-    # Interpolate goal weights at window edges
-    y1_start, y1_end = np.interp([x1.toordinal(), x2.toordinal()], goal1_ord, goal1_y)
-    y2_start, y2_end = np.interp([x1.toordinal(), x2.toordinal()], goal2_ord, goal2_y)
-
-    # Compute spans (weight differences over the range)
-    span1 = y1_end - y1_start
-    span2 = y2_end - y2_start
-    if abs(span2) < 1e-9:
-        span2 = 1e-9  # avoid div-by-zero
-
-    # Scale factor to align Simon’s line visually to Kevin’s
-    scale = span1 / span2
-
-    # Align Simon’s goal line so that start and end visually match Kevin’s
-    y1_range = y1_start - y1_end
-    y2_range = y2_start - y2_end
-
-    # Determine max visible weight for Kevin in selected range
-    mask = (df_kevin["date"] >= x1) & (df_kevin["date"] <= x2)
-    if not df_kevin.loc[mask].empty:
-        max_value = df_kevin.loc[mask, "weight"].max()
-    else:
-        max_value = max(y1_start, y1_end)
-
-    mask = (df_kevin["date"] >= x1) & (df_kevin["date"] <= x2)
-    if not df_kevin.loc[mask].empty:
-        min_value = df_kevin.loc[mask, "weight"].min()
-        min_value = min(min_value, y1_end)
-    else:
-        min_value = min(y1_start, y1_end)
-
-    margin1 = max_value - y1_start + 1
-    margin2 = y1_end - min_value + 1
-
-    # Apply proportional margins
-    y1_margin1 = margin1
-    y1_margin2 = margin2
-    y1_min = y1_end - y1_margin2
-    y1_max = y1_start + y1_margin1
-
-    y2_margin1 = y2_range/y1_range * y1_margin1
-    y2_margin2 = y2_range/y1_range * y1_margin2
-    y2_min = y2_end - y2_margin2
-    y2_max = y2_start + y2_margin1
-
-    # # Debug output in Streamlit
-    # st.write(f"🧭 **Debug Info:** {x1.date()}–{x2.date()}")
-    # st.write(f"Kevin goals: {y1_start:.2f} → {y1_end:.2f}")
-    # st.write(f"Simon goals: {y2_start:.2f} → {y2_end:.2f}")
-    # st.write(f"Computed aligned y1: [{y1_min:.2f}, {y1_max:.2f}], y2: [{y2_min:.2f}, {y2_max:.2f}]")
-    # st.write("---")
-
-    return [y1_min, y1_max], [y2_min, y2_max]
-
-import numpy as np  # ensure np is imported for proportional zoom
-
-# --- X-axis range ---
-min_date = (
-    min(df_kevin["date"].min(), df_simon["date"].min())
-    if simon_available and not df_simon.empty
-    else df_kevin["date"].min()
-)
-
-today = pd.Timestamp.today()
+    df_comp = _df[(_df["date"] >= goal_start_date) & (_df["date"] <= goal_end_date)] if not _df.empty else _df
+    profiler.note(cache="miss", points=len(df_comp))
+    return compute_trendline(df_comp, goal_end_date, trend_type)
+
+trends = {}
+for p in plotted:
+    with profiler.stage("trend", user=p["id"], trend_type=trend_type, cache="hit"):
+        trends[p["id"]] = cached_trendline(
+            p["id"], versions[p["id"]], trend_type, goal_start_date, goal_end_date, frames[p["id"]]
+        )
 
 
+# --- Rolling averages and weekly loss rates ---
+@st.cache_data(max_entries=TREND_CACHE_ENTRIES)
+def cached_rolling(user, version, _df):
+    """rolling_frames() of the user's frame, cached per data version like the trendline."""
+    profiler.note(cache="miss", points=len(_df))
+    return rolling_frames(_df)
 
-if time_range == "Last 14 Days":
-    x_min = (today - pd.Timedelta(days=14)).normalize()
-    x_max = (today + pd.Timedelta(days=7)).normalize()
-elif time_range == "Last 30 Days":
-    x_min = (today - pd.Timedelta(days=30)).normalize()
-    x_max = (today + pd.Timedelta(days=10)).normalize()
-else:  # "Competition Timeline"
-    x_min = goal_start_date
-    x_max = goal_end_date
+rolling = {}
+for p in plotted:
+    with profiler.stage("rolling", user=p["id"], cache="hit"):
+        rolling[p["id"]] = cached_rolling(p["id"], versions[p["id"]], frames[p["id"]])
 
-x1 = x_min
-x2 = x_max
-# Recompute aligned y-ranges for the selected window using GOAL lines (not trendlines)
-y1_range, y2_range = aligned_ranges_from_goals(
-    x1, x2, goal_dates_kevin, kevin_goal_weights, goal_dates_simon, simon_goal_weights, df_kevin, df_simon
-)
-x_range = [x_min, x_max]
+# --- Aligned Axis Ranges ---
+@st.cache_data(max_entries=GOAL_CACHE_ENTRIES)
+def cached_axis_ranges(participant_key, today, _goals, _df_ref):
+    """
+    axis_ranges(): {time_range: [[low, high] or None per plotted user]}.
+    Cached per day and per (start weight, data version) of the plotted users.
+    """
+    profiler.note(cache="miss")
+    return axis_ranges(today, _goals, _df_ref, goal_start_date, goal_end_date)
 
 
+# --- Figure ---
+FIGURE_CACHE_ENTRIES = 64
 
-# --- Layout ---
-fig.update_layout(
-    showlegend=False,
-    height=500,
-    yaxis=dict(
-        title="Kevin",
-        side="left",
-        range=y1_range,
-        showgrid=True,
-        tickformat=".1f"
-    ),
-    xaxis=dict(
-        title="Date",
-        range=x_range,  # Keep manual range logic
-        type="date"
-    )
-)
 
-if y2_range is not None:
-    fig.update_layout(
-        yaxis2=dict(
-            title="Simon",
-            overlaying="y",
-            side="right",
-            range=y2_range,
-            showgrid=False,
-            tickformat=".1f",
-            anchor="x",
-            matches=None
-        )
+@st.cache_resource(max_entries=FIGURE_CACHE_ENTRIES)
+def cached_figure(participant_key, time_range, show_trendlines, trend_type, rolling_window, x_min, x_max,
+                  _plotted, _frames, _goals, _trends, _rolling, _stats, _y_ranges):
+    """
+    build_figure() for one view. Building and validating a Plotly figure costs
+    more than the rest of a rerun, so built figures are shared by every session
+    and only rebuilt when the view or a user's data changes. participant_key
+    holds (id, name, color, start weight, data version) per plotted user and
+    stands in for the unhashed frames, goals, trends, rolling averages, stats
+    and y-ranges. Returned figures are shared: never modify them.
+    """
+    profiler.note(cache="miss")
+    return build_figure(
+        show_trendlines, trend_type, rolling_window, x_min, x_max,
+        _plotted, _frames, _goals, _trends, _rolling, _stats, _y_ranges,
     )
 
 
-
-st.plotly_chart(fig, use_container_width=True)
+participant_key = tuple(
+    (p["id"], p["name"], p["color"], float(stats.loc[p["id"], "start_weight"]), versions[p["id"]])
+    for p in plotted
+)
+with profiler.stage("axis_ranges", cache="hit"):
+    y_ranges = cached_axis_ranges(
+        participant_key, today.normalize(), [goals[p["id"]] for p in plotted],
+        frames[plotted[0]["id"]] if plotted else pd.DataFrame(),
+    )
+with profiler.stage("figure", time_range=time_range, cache="hit"):
+    fig = cached_figure(
+        participant_key, time_range, show_trendlines, trend_type, rolling_window, x_min, x_max,
+        plotted, frames, goals, trends, rolling, stats, y_ranges[time_range],
+    )
+with profiler.stage("plotly_chart", traces=len(fig.data)) as stage:
+    if profiler.enabled:
+        # Roughly what st.plotly_chart sends to the browser; only paid for when profiling
+        stage["bytes"] = len(fig.to_json(validate=False))
+    st.plotly_chart(fig, use_container_width=True)
 
 st.markdown("---")
 
@@ -444,12 +809,21 @@ col1, col2, col3 = st.columns([2, 1, 1])
 with col1:
     time_range = st.radio(
         "Time Range",
-        options=["Last 14 Days", "Last 30 Days", "Competition Timeline"],
+        options=TIME_RANGES,
         index=2,
         horizontal=True,
         key="time_range"
     )
 
+with col2:
+    rolling_window = st.radio(
+        "Rolling Average",
+        options=[0, *ROLLING_WINDOWS],
+        format_func=lambda days: f"{days} Days" if days else "Off",
+        horizontal=False,
+        key="rolling_window"
+    )
+
 with col3:
     show_trendlines = st.checkbox("Show Trendlines", value=True, key="show_trendlines")
     if show_trendlines:
@@ -467,72 +841,73 @@ st.markdown("---")
 
 # --- Legend below controls ---
 st.markdown("### Legend")
-st.markdown("""
-| Symbol | Description |
-|:--|:--|
-| 🟦 | **Kevin** |
-| 🟩 | **Simon** |
-""")
-
-# --- Show message if Simon's data is missing or invalid ---
-if simon_available and simon_start_weight is None:
-    st.markdown(
-        "<div style='color: red; font-size: 16px; margin-top: 20px;'>"
-        "⚠️ No suitable starting weight found for Simon near the defined start date. "
-        "Simon’s trendline and statistics may be unavailable until data is entered."
-        "</div>",
-        unsafe_allow_html=True
-    )
-elif not simon_available:
-    st.markdown(
-        "<div style='color: orange; font-size: 16px; margin-top: 20px;'>"
-        "ℹ️ No data available for Simon yet. Please enter weight data to begin tracking."
-        "</div>",
-        unsafe_allow_html=True
-    )
-
-
-# --- Simon Manual Entry Section ---
-with st.expander("➕ Add Manual Weight Entry for Simon"):
-    with st.form("simon_data_entry"):
-        weight = st.number_input("Weight (kg)", value=100.0, min_value=30.0, max_value=200.0, step=0.01, format="%.2f")
-        body_fat = st.number_input("Body Fat (%)", min_value=0.0, max_value=100.0, step=0.1, format="%.1f")
-        date = st.date_input("Date of Measurement", value=datetime.date.today())
-
-        submitted = st.form_submit_button("Submit Data")
-
-        if submitted:
-            try:
-                date_str = date.isoformat()  # e.g., "2025-07-28"
-                body_fat_cleaned = None if body_fat == 0.0 else round(body_fat, 1)
-                weight_cleaned = round(weight, 2)
-
-                # Get current UTC timestamp
-                timestamp = datetime.datetime.utcnow().isoformat()
-
-                # Query existing entries for that day
-                collection_ref = db.collection("users").document("simon").collection("weight_data")
-                existing_docs = collection_ref.where("date", "==", date_str).stream()
-                count = sum(1 for _ in existing_docs)
-
-                # Create doc ID like "2025-07-28_1", "2025-07-28_2", ...
-                doc_id = f"{date_str}_{count + 1}"
-
-                doc_ref = collection_ref.document(doc_id)
-                doc_ref.set({
-                    "date": date_str,
-                    "weight": weight_cleaned,
-                    "bodyFat": body_fat_cleaned,
-                    "entryTime": timestamp
-                })
+st.markdown(
+    "| Symbol | Description |\n|:--|:--|\n" + "\n".join(
+        f"| <span style='color: {p['color']};'>■</span> | **{p['name']}** |" for p in participants
+    ),
+    unsafe_allow_html=True
+)
 
-                st.success(f"✅ Entry saved for {date_str} as #{count + 1}")
+# --- Show message if a participant's data is missing or invalid ---
+for p in participants:
+    if frames[p["id"]].empty:
+        st.markdown(
+            "<div style='color: orange; font-size: 16px; margin-top: 20px;'>"
+            f"ℹ️ No data available for {p['name']} yet. Please enter weight data to begin tracking."
+            "</div>",
+            unsafe_allow_html=True
+        )
 
-                if hasattr(st, "experimental_rerun"):
-                    st.experimental_rerun()
 
-            except Exception as e:
-                st.error(f"❌ Failed to save data: {e}")
+# --- Manual Entry Section ---
+manual_participants = [p for p in participants if p.get("manual_entry")]
+entry_label = manual_participants[0]["name"] if len(manual_participants) == 1 else "a Participant"
+
+if manual_participants:
+    with st.expander(f"➕ Add Manual Weight Entry for {entry_label}"):
+        with st.form("manual_data_entry"):
+            entry_user = st.selectbox(
+                "Participant",
+                options=[p["id"] for p in manual_participants],
+                format_func=lambda uid: next(p["name"] for p in manual_participants if p["id"] == uid),
+                disabled=len(manual_participants) == 1
+            )
+            weight = st.number_input("Weight (kg)", value=100.0, min_value=30.0, max_value=200.0, step=0.01, format="%.2f")
+            body_fat = st.number_input("Body Fat (%)", min_value=0.0, max_value=100.0, step=0.1, format="%.1f")
+            date = st.date_input("Date of Measurement", value=datetime.date.today())
+
+            submitted = st.form_submit_button("Submit Data")
+
+            if submitted:
+                try:
+                    date_str = date.isoformat()  # e.g., "2025-07-28"
+                    body_fat_cleaned = None if body_fat == 0.0 else round(body_fat, 1)
+                    weight_cleaned = round(weight, 2)
+
+                    # Get current UTC timestamp
+                    timestamp = datetime.datetime.utcnow().isoformat()
+
+                    # Doc ID derived from the entry itself, so a double submit
+                    # overwrites instead of adding a second reading
+                    doc_id = firestore_sync.weight_doc_id(date_str, weight_cleaned, "manual")
+                    add_reading(entry_user, doc_id, {
+                        "date": date_str,
+                        "weight": weight_cleaned,
+                        "bodyFat": body_fat_cleaned,
+                        "entryTime": timestamp,
+                        "source": "manual"
+                    })
+
+                    # Rerun so the chart above picks up the new data version;
+                    # the confirmation is shown by that rerun
+                    st.session_state["manual_entry_saved"] = f"✅ Entry saved for {date_str} ({weight_cleaned:.2f} kg)"
+                    st.rerun()
+
+                except Exception as e:
+                    st.error(f"❌ Failed to save data: {e}")
+
+        if "manual_entry_saved" in st.session_state:
+            st.success(st.session_state.pop("manual_entry_saved"))
 
 # --- Stats Section ---
 st.markdown('<div class="stats-container">', unsafe_allow_html=True)
@@ -551,30 +926,45 @@ st.markdown("""
 # --- Stats Section with Streamlit Columns ---
 st.markdown('<div class="small-font">', unsafe_allow_html=True)
 
-col1, col2 = st.columns(2)
-
-with col1:
-    st.subheader("Kevin's Stats")
-    latest_k = df_kevin.dropna(subset=["weight"])["weight"].iloc[-1]
-    loss_k = kevin_start_weight - latest_k
-    loss_pct_k = 100 * loss_k / (kevin_start_weight - kevin_goal_weight)
-    st.metric("Starting Weight", f"{kevin_start_weight:.1f} kg")
-    st.metric("Latest Weight", f"{latest_k:.1f} kg")
-    st.metric("Total Loss", f"{loss_k:.1f} kg ({loss_pct_k:.1f}% of goal)")
-    st.metric("Goal Weight", f"{kevin_goal_weight:.1f} kg")  # ✅ Added
-
-if simon_available and simon_start_weight is not None:
-    with col2:
-        st.subheader("Simon's Stats")
-        latest_s = df_simon.dropna(subset=["weight"])["weight"].iloc[-1]
-        loss_s = simon_start_weight - latest_s
-        loss_pct_s = 100 * loss_s / (simon_start_weight - simon_goal_weight)
-        st.metric("Starting Weight", f"{simon_start_weight:.1f} kg")
-        st.metric("Latest Weight", f"{latest_s:.1f} kg")
-        st.metric("Total Loss", f"{loss_s:.1f} kg ({loss_pct_s:.1f}% of goal)")
-        st.metric("Goal Weight", f"{simon_goal_weight:.1f} kg")  # ✅ Added
-
-if simon_available and simon_start_weight is None:
-    st.warning("Simon's starting weight could not be determined. No data near the goal start date.")
+stats_participants = [p for p in plotted if pd.notna(stats.loc[p["id"], "latest_weight"])]
+stat_cols = st.columns(max(2, min(4, len(stats_participants))))
+
+for i, p in enumerate(stats_participants):
+    row = stats.loc[p["id"]]
+    with stat_cols[i % len(stat_cols)]:
+        st.subheader(f"{p['name']}'s Stats")
+        st.metric("Starting Weight", f"{row['start_weight']:.1f} kg")
+        st.metric("Latest Weight", f"{row['latest_weight']:.1f} kg")
+        st.metric("Total Loss", f"{row['loss']:.1f} kg ({row['loss_pct']:.1f}% of goal)")
+        st.metric("Goal Weight", f"{row['goal_weight']:.1f} kg")  # ✅ Added
+
+        # Trailing averages as of the latest reading, with the weekly rate over the same window
+        for window, df_rolling in rolling[p["id"]].items():
+            latest = df_rolling.iloc[-1] if not df_rolling.empty else None
+            if latest is None or pd.isna(latest["weight"]):
+                continue
+            st.metric(
+                f"{window}-Day Average", f"{latest['weight']:.1f} kg",
+                delta=None if pd.isna(latest["weekly_loss"]) else f"{-latest['weekly_loss']:+.2f} kg/week",
+                delta_color="inverse",
+            )
 
 st.markdown('</div>', unsafe_allow_html=True)
+
+
+# --- Live updates ---
+@st.fragment(run_every=LIVE_CHECK_SECONDS)
+def rerun_on_new_data(rendered_versions):
+    """Rerun the page once a listener or reload changed a user's data; an in-memory check, no reads."""
+    if any(_user_state(user)["version"] != version for user, version in rendered_versions.items()):
+        st.rerun()
+
+
+if LIVE_UPDATES:
+    rerun_on_new_data(versions)
+
+# --- Profile panel (?profile=1) ---
+if profiler.enabled:
+    total_ms = profiler.finish()
+    with st.expander(f"🛠 Profile: {total_ms:.0f} ms this rerun", expanded=False):
+        st.dataframe(pd.DataFrame(profiler.records).sort_values("start_ms"), use_container_width=True, hide_index=True)
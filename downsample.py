@@ -0,0 +1,67 @@
+"""Resolution-aware downsampling of chart series (Largest-Triangle-Three-Buckets)."""
+
+import numpy as np
+
+
+def lttb(x, y, n_out):
+    """
+    Indices of the n_out points that best keep the shape of the (x, y) line
+    (Steinarsson's Largest-Triangle-Three-Buckets). x must be sorted; the first
+    and last points are always kept.
+    """
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1])[:max(n_out, 0)]
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # Bucket i covers [edges[i], edges[i + 1]); points 0 and n - 1 are buckets of their own
+    edges = np.floor(np.arange(n_out - 1) * (n - 2) / (n_out - 2)).astype(int) + 1
+    edges[-1] = n - 1
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts
+    mean_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts
+    # The bucket after the last one is the final point itself
+    mean_x = np.append(mean_x, x[-1])
+    mean_y = np.append(mean_y, y[-1])
+
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Twice the area of the triangle (point a, candidate, next bucket's mean)
+        area = np.abs(
+            (x[a] - mean_x[i + 1]) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (mean_y[i + 1] - y[a])
+        )
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def window_indices(x, y, x_min, x_max, width_points):
+    """
+    Indices of the points worth sending to the chart: every point inside the
+    visible window [x_min, x_max], and outside it LTTB at the on-screen density
+    (width_points across the window), capped at width_points per side so the
+    payload stays bounded however long the history gets.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    lo, hi = np.searchsorted(x, x_min, side="left"), np.searchsorted(x, x_max, side="right")
+    window_span = max(x_max - x_min, 1e-9)
+
+    parts = []
+    for start, stop, inside in ((0, lo, False), (lo, hi, True), (hi, len(x), False)):
+        idx = np.arange(start, stop)
+        if not inside and len(idx):
+            idx = idx[np.isfinite(y[idx])]
+            span = x[idx[-1]] - x[idx[0]] if len(idx) else 0.0
+            budget = min(width_points, max(3, int(np.ceil(width_points * span / window_span))))
+            idx = idx[lttb(x[idx], y[idx], budget)]
+        parts.append(idx)
+    return np.concatenate(parts)
@@ -0,0 +1,239 @@
+"""Vectorized LOWESS, matching statsmodels' lowess(..., it=0, delta=0) to rounding error.
+
+Each point is fitted by a tricube-weighted linear regression over its k = frac * n
+nearest neighbours, like statsmodels, but without a Python loop per point:
+
+- tied x values (several readings a day) are fitted once and share the fit,
+  as in statsmodels;
+- small series are fitted with one dense (rows x k) gather of the windows, and
+  several series can share that pass;
+- large series use per-chunk prefix sums of the tricube moments, so the cost is
+  O(n) instead of O(n * k). Rows where that would lose precision fall back to
+  the dense fit.
+
+One exception, common with several readings a day: when all the non-zero
+weight sits on the points tied with x_i, the regression has no x spread.
+statsmodels clamps that zero variance to 1e-12, which turns rounding error
+into noise of up to ~1e-3; these rows get the exact mean of the tied y
+values instead.
+"""
+
+from math import comb
+
+import numpy as np
+
+# Largest rows x k block the dense fit materialises at once
+DENSE_MAX_CELLS = 2_000_000
+# Series with n * k up to this size are fitted densely
+DENSE_MAX_WORK = 250_000
+# The moment fit is only used while chunk scale / neighbourhood radius stays
+# below this; the binomial re-centering amplifies rounding error by ~(2 * ratio) ** 11
+MAX_SCALE_RATIO = 1.5
+
+# (1 - |t|**3)**3 > 1e-12  <=>  |t| < (1 - 1e-4) ** (1/3): statsmodels' "non-zero weight"
+_NONZERO_T = (1.0 - 1e-4) ** (1.0 / 3.0)
+_MAX_POWER = 11  # tricube (t**9) times the t**2 of the regression
+_POWERS = np.arange(_MAX_POWER + 1)
+_BINOM = np.array([[comb(m, a) for a in _POWERS] for m in _POWERS], dtype=float)
+_SHIFT = np.clip(_POWERS[:, None] - _POWERS[None, :], 0, None)
+
+
+def lowess(endog, exog, frac=0.3):
+    """Drop-in for statsmodels' lowess(endog, exog, frac=frac, it=0).
+
+    Returns an (n, 2) array of the sorted x values and their fitted values.
+    """
+    return lowess_batch([(exog, endog)], frac=frac)[0]
+
+
+def lowess_batch(series, frac=0.3):
+    """Smooth several (x, y) series in one call; returns one (n, 2) array per series."""
+    prepared = [_prepare(x, y, frac) for x, y in series]
+    fits = [None] * len(prepared)
+
+    dense = [i for i, p in enumerate(prepared) if len(p["heads"]) * p["k"] <= DENSE_MAX_WORK]
+    if dense:
+        # Concatenate the small series so all of them share one vectorized pass
+        offsets = np.cumsum([0] + [len(prepared[i]["x"]) for i in dense])
+        x = np.concatenate([prepared[i]["x"] for i in dense])
+        y = np.concatenate([prepared[i]["y"] for i in dense])
+        left = np.concatenate([prepared[i]["left"] + off for i, off in zip(dense, offsets)])
+        first = np.concatenate([prepared[i]["first"] + off for i, off in zip(dense, offsets)])
+        k = np.concatenate([np.full(len(prepared[i]["x"]), prepared[i]["k"]) for i in dense])
+        radius = np.concatenate([prepared[i]["radius"] for i in dense])
+        heads = np.concatenate([prepared[i]["heads"] + off for i, off in zip(dense, offsets)])
+        fit = np.empty(len(x))
+        fit[heads] = _fit_dense(x, y, heads, left[heads], k[heads], radius[heads], first)
+        for i, start, stop in zip(dense, offsets[:-1], offsets[1:]):
+            fits[i] = fit[start:stop]
+
+    for i, p in enumerate(prepared):
+        if fits[i] is None:
+            fits[i] = _fit_moments(p)
+        rows, means = _tied_means(p)
+        fits[i][rows] = means
+        # Tied x values all take the fit of the first one, as in statsmodels
+        fits[i] = fits[i][p["first"]]
+
+    return [np.column_stack([p["x"], fit]) for p, fit in zip(prepared, fits)]
+
+
+def _prepare(x, y, frac):
+    """Sort like statsmodels and find every point's k-nearest-neighbour window."""
+    if not 0 <= frac <= 1:
+        raise ValueError("Lowess `frac` must be in the range [0,1]!")
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = np.isfinite(x) & np.isfinite(y)
+    x, y = x[valid], y[valid]
+    order = np.argsort(x)
+    x, y = x[order], y[order]
+
+    n = len(x)
+    k = min(max(int(frac * n + 1e-10), 2), n)
+    # statsmodels slides [left, left + k) right while x_i > (x[left] + x[left + k]) / 2
+    mids = (x[:n - k] + x[k:]) / 2.0
+    left = np.searchsorted(mids, x, side="left")
+    radius = np.maximum(x - x[left], x[np.minimum(left + k, n) - 1] - x) if n else x
+    # Only the first of each run of tied x values is fitted; the others share its fit
+    first = np.searchsorted(x, x, side="left")
+    heads = np.flatnonzero(first == np.arange(n))
+    return {"x": x, "y": y, "k": k, "left": left, "radius": radius, "first": first, "heads": heads}
+
+
+def _tied_means(p):
+    """(rows, fits) of the rows whose non-zero weights all fall on x_i's tied points: their mean y."""
+    x, y, k, left, radius, first = p["x"], p["y"], p["k"], p["left"], p["radius"], p["first"]
+    end = left + k
+    # The tie run of x_i inside its window, and the window points with a non-zero weight
+    lo, hi = np.maximum(first, left), np.minimum(np.searchsorted(x, x, side="right"), end)
+    reach_lo = np.maximum(np.searchsorted(x, x - radius, side="right"), left)
+    reach_hi = np.minimum(np.searchsorted(x, x + radius, side="left"), end)
+    rows = np.flatnonzero((radius > 0) & (reach_lo >= lo) & (reach_hi <= hi) & (hi - lo >= 2))
+    prefix = np.concatenate([[0.0], np.cumsum(y)])
+    return rows, (prefix[hi[rows]] - prefix[lo[rows]]) / (hi[rows] - lo[rows])
+
+
+def _powers(v):
+    """Rows v**0 .. v**_MAX_POWER by repeated multiplication (much cheaper than **)."""
+    out = np.empty((_MAX_POWER + 1, len(v)))
+    out[0] = 1.0
+    for m in range(1, _MAX_POWER + 1):
+        np.multiply(out[m - 1], v, out=out[m])
+    return out
+
+
+def _fit_dense(x, y, rows, left, k, radius, first):
+    """Weighted regression for each row over its materialised window."""
+    fit = np.empty(len(rows))
+    if not len(rows):
+        return fit
+
+    k_max = int(k.max())
+    offsets = np.arange(k_max)
+    step = max(1, DENSE_MAX_CELLS // k_max)
+
+    for start in range(0, len(rows), step):
+        block = slice(start, start + step)
+        r, lo = rows[block], left[block]
+        valid = offsets < k[block][:, None]
+        idx = np.where(valid, lo[:, None] + offsets, lo[:, None])
+        xj, yj, xv = x[idx], y[idx], x[r]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            d = np.abs(xj - xv[:, None]) / radius[block][:, None]
+            w = 1.0 - d * d * d
+            w = np.where(valid, w * w * w, 0.0)
+            ok = (w > 1e-12).sum(axis=1) >= 2
+            w = w / w.sum(axis=1, keepdims=True)
+            x_bar = (w * xj).sum(axis=1)
+            dev = xj - x_bar[:, None]
+            var = np.maximum((w * dev * dev).sum(axis=1), 1e-12)
+            slope = (w * dev * yj).sum(axis=1) / var
+            fit[block] = np.where(ok, (w * yj).sum(axis=1) + (xv - x_bar) * slope, y[first[r]])
+
+    return fit
+
+
+def _fit_moments(p):
+    """
+    O(n) fit of one series. With t = (x_j - x_i) / radius the tricube weight is a
+    polynomial on either side of x_i: (1 - t**3)**3 right, (1 + t**3)**3 left. All
+    regression sums are therefore combinations of window sums of t**m and t**m * y,
+    which come from prefix sums over a chunk, re-centred per row.
+    """
+    x, y, k, left, radius, first, heads = p["x"], p["y"], p["k"], p["left"], p["radius"], p["first"], p["heads"]
+    n = len(x)
+    fit = np.empty(n)
+    end = left + k
+    split = np.clip(first, left, end)  # window points left of x_i are [left, split)
+    chunk = max(1, k // 4)
+    fallback = []
+
+    for a in range(0, n, chunk):
+        rows = heads[np.searchsorted(heads, a):np.searchsorted(heads, a + chunk)]
+        if not len(rows):
+            continue
+        lo, hi = int(left[rows].min()), int(end[rows].max())
+        center = (x[lo] + x[hi - 1]) / 2.0
+        scale = (x[hi - 1] - x[lo]) / 2.0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = scale / radius[rows]
+        precise = np.isfinite(ratio) & (ratio <= MAX_SCALE_RATIO) & (scale > 0)
+        fallback.append(rows[~precise])
+        rows, ratio = rows[precise], ratio[precise]
+        if not len(rows):
+            continue
+
+        # Prefix sums of v**a and v**a * y, v = (x - center) / scale in [-1, 1]
+        v_pow = _powers((x[lo:hi] - center) / scale)
+        prefix = np.zeros((_MAX_POWER + 1, hi - lo + 1))
+        prefix_y = np.zeros((_MAX_POWER + 1, hi - lo + 1))
+        np.cumsum(v_pow, axis=1, out=prefix[:, 1:])
+        np.cumsum(v_pow * y[lo:hi], axis=1, out=prefix_y[:, 1:])
+
+        # t**m = ratio**m * sum_a C(m, a) v_j**a (-v_i)**(m - a)
+        v_i = (x[rows] - center) / scale
+        to_t = (
+            _BINOM[None]
+            * _powers(-v_i).T[:, _SHIFT]
+            * _powers(ratio).T[:, :, None]
+        )
+
+        start, mid, stop = left[rows] - lo, split[rows] - lo, end[rows] - lo
+        sums = {}
+        for side, (s, e) in (("left", (start, mid)), ("right", (mid, stop))):
+            sums[side] = (
+                np.einsum("rma,ar->rm", to_t, prefix[:, e] - prefix[:, s]),
+                np.einsum("rma,ar->rm", to_t, prefix_y[:, e] - prefix_y[:, s]),
+            )
+
+        s0 = s1 = s2 = sy = s1y = 0.0
+        for side, sign in (("left", -1.0), ("right", 1.0)):
+            t_mom, ty_mom = sums[side]
+            # (1 - sign * t**3)**3 = 1 - 3 sign t**3 + 3 t**6 - sign t**9
+            for power, coef in ((0, 1.0), (3, -3.0 * sign), (6, 3.0), (9, -sign)):
+                s0 = s0 + coef * t_mom[:, power]
+                s1 = s1 + coef * t_mom[:, power + 1]
+                s2 = s2 + coef * t_mom[:, power + 2]
+                sy = sy + coef * ty_mom[:, power]
+                s1y = s1y + coef * ty_mom[:, power + 1]
+
+        # Regression in t coordinates, evaluated at t = 0
+        r2 = radius[rows] ** 2
+        t_bar = s1 / s0
+        var_t = np.maximum(r2 * (s2 / s0 - t_bar ** 2), 1e-12) / r2
+        y_fit = sy / s0 - t_bar / var_t * (s1y / s0 - t_bar * sy / s0)
+
+        # At least two points with a non-zero weight, or fall back to y
+        reach = _NONZERO_T * radius[rows]
+        inner = (
+            np.minimum(np.searchsorted(x, x[rows] + reach, side="left"), end[rows])
+            - np.maximum(np.searchsorted(x, x[rows] - reach, side="right"), left[rows])
+        )
+        fit[rows] = np.where(inner >= 2, y_fit, y[first[rows]])
+
+    fallback = np.concatenate(fallback) if fallback else np.array([], dtype=int)
+    fit[fallback] = _fit_dense(x, y, fallback, left[fallback], np.full(len(fallback), k), radius[fallback], first)
+    return fit
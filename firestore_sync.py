@@ -0,0 +1,214 @@
+"""Firestore sync helpers shared by the scrapers and the dashboard."""
+
+import datetime
+import hashlib
+import os
+import sys
+from collections import defaultdict
+
+import requests
+from google.cloud import firestore as gcf
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+import scrape_metrics
+
+DASHBOARD_URL = os.getenv("DASHBOARD_URL", "https://fatboyslim.streamlit.app/")
+
+# Firestore rejects a WriteBatch with more than 500 writes
+BATCH_LIMIT = 500
+
+# Daily means are also kept in one rollup doc per user and year
+# (users/{user}/meta/rollup_{year}) as parallel arrays sorted by day of year:
+# {"year": 2025, "days": [1, 2, ...], "weight": [...], "bodyFat": [...]}.
+# users/{user}/meta/rollup records when each year changed and whether the
+# rollup covers the full history ("complete", set by a rebuild).
+ROLLUP_INDEX = "rollup"
+
+
+def weight_doc_id(date_str, weight, source):
+    """Content-derived doc ID like "2025-07-28_3f9a1c2b0d".
+
+    The same reading always maps to the same document, so writers can use a
+    blind set() instead of querying the day first, and re-running a sync is a
+    no-op rather than a duplicate.
+    """
+    digest = hashlib.sha1(f"{source}|{date_str}|{float(weight):.2f}".encode()).hexdigest()[:10]
+    return f"{date_str}_{digest}"
+
+
+def daily_doc_id(date_str, source):
+    """Doc ID like "2025-07-28_garmin" for sources that store one value per day.
+
+    A refetched day whose value changed overwrites its doc instead of adding
+    a second one next to it.
+    """
+    return f"{date_str}_{source}"
+
+
+def reading_doc_id(date_str, source, reading_id):
+    """Doc ID like "2025-07-28_withings_1234567" for sources that give every reading its own ID.
+
+    A refetched or edited reading overwrites its own doc, and readings of the
+    same day sit side by side without reading the day first.
+    """
+    return f"{date_str}_{source}_{reading_id}"
+
+
+def commit_batched(db, writes, stamp_field=None):
+    """Set (doc_ref, data) pairs using as few WriteBatch commits as possible.
+
+    A pair with data None deletes the doc instead. With `stamp_field`, every
+    doc set gets that field set to the server time of its batch's commit, so
+    later commits always carry later stamps, whatever the writers' clocks
+    say. Returns the number of documents written (set or deleted).
+    """
+    batch = db.batch()
+    pending = 0
+    written = 0
+
+    for doc_ref, data in writes:
+        if data is None:
+            batch.delete(doc_ref)
+        else:
+            batch.set(doc_ref, {**data, stamp_field: gcf.SERVER_TIMESTAMP} if stamp_field else data)
+        pending += 1
+        if pending == BATCH_LIMIT:
+            with scrape_metrics.call("firestore", "batch_commit", writes=pending):
+                batch.commit()
+            written += pending
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        with scrape_metrics.call("firestore", "batch_commit", writes=pending):
+            batch.commit()
+        written += pending
+
+    return written
+
+
+def notify_dashboard(user, version):
+    """Ping the dashboard once per sync run so it reloads only this user's data.
+
+    `version` identifies the sync (e.g. its scraped_at stamp); the dashboard
+    ignores a version it has already seen.
+    """
+    try:
+        with scrape_metrics.call("api", "dashboard_ping"):
+            requests.get(DASHBOARD_URL, params={"refresh": 1, "user": user, "v": version}, timeout=10)
+    except requests.exceptions.RequestException as e:
+        print(f"⚠️ Dashboard refresh ping failed: {e}")
+
+
+def _daily_means(docs):
+    """Mean weight/bodyFat per date of raw weight docs: {date: (weight, bodyFat or None)}."""
+    weights = defaultdict(list)
+    fats = defaultdict(list)
+    for doc in docs:
+        data = doc.to_dict()
+        if data.get("date") and data.get("weight") is not None:
+            weights[data["date"]].append(data["weight"])
+            if data.get("bodyFat") is not None:
+                fats[data["date"]].append(data["bodyFat"])
+
+    return {
+        date: (sum(w) / len(w), sum(fats[date]) / len(fats[date]) if fats[date] else None)
+        for date, w in weights.items()
+    }
+
+
+def _rollup_doc(year, rows):
+    """Pack {day of year: (weight, bodyFat)} into the rollup document layout."""
+    days = sorted(rows)
+    return {
+        "year": year,
+        "days": days,
+        "weight": [rows[d][0] for d in days],
+        "bodyFat": [rows[d][1] for d in days],
+        "updated_at": datetime.datetime.now().isoformat(),
+    }
+
+
+@gcf.transactional
+def _update_rollup_year(transaction, user_ref, year, first, last):
+    meta = user_ref.collection("meta")
+    rollup_ref = meta.document(f"rollup_{year}")
+
+    snapshot = rollup_ref.get(transaction=transaction)
+    current = snapshot.to_dict() if snapshot.exists else {}
+    rows = dict(zip(current.get("days", []), zip(current.get("weight", []), current.get("bodyFat", []))))
+
+    # Recompute every day between first and last from the raw docs, so re-running
+    # a sync (same doc IDs) never counts a reading twice
+    query = (
+        user_ref.collection("weight_data").select(["date", "weight", "bodyFat"])
+        .where(filter=FieldFilter("date", ">=", first))
+        .where(filter=FieldFilter("date", "<=", last))
+    )
+    docs = list(transaction.get(query))
+    means = _daily_means(docs)
+
+    day = datetime.date.fromisoformat(first)
+    while day <= datetime.date.fromisoformat(last):
+        day_of_year = day.timetuple().tm_yday
+        rows.pop(day_of_year, None)
+        if day.isoformat() in means:
+            rows[day_of_year] = means[day.isoformat()]
+        day += datetime.timedelta(days=1)
+
+    doc = _rollup_doc(year, rows)
+    transaction.set(rollup_ref, doc)
+    transaction.set(meta.document(ROLLUP_INDEX), {"updated": {str(year): doc["updated_at"]}}, merge=True)
+    return 1 + len(docs)  # documents read
+
+
+def update_daily_rollup(db, user, dates):
+    """Refresh the rollup for the given ISO dates, one transaction per year."""
+    by_year = defaultdict(list)
+    for date in dates:
+        by_year[int(date[:4])].append(date)
+
+    user_ref = db.collection("users").document(user)
+    for year, year_dates in by_year.items():
+        # Two writes per year: the rollup doc and the index
+        with scrape_metrics.call("firestore", "rollup_update", writes=2) as stats:
+            stats["reads"] = _update_rollup_year(db.transaction(), user_ref, year, min(year_dates), max(year_dates))
+
+
+def rebuild_daily_rollup(db, user):
+    """Rebuild every rollup year from the full weight_data collection and mark it complete."""
+    user_ref = db.collection("users").document(user)
+    with scrape_metrics.call("firestore", "rollup_rebuild_read") as stats:
+        docs = list(user_ref.collection("weight_data").select(["date", "weight", "bodyFat"]).stream())
+        stats["reads"] = len(docs)
+
+    by_year = defaultdict(dict)
+    for date, means in _daily_means(docs).items():
+        day = datetime.date.fromisoformat(date)
+        by_year[day.year][day.timetuple().tm_yday] = means
+
+    meta = user_ref.collection("meta")
+    writes = [(meta.document(f"rollup_{year}"), _rollup_doc(year, rows)) for year, rows in by_year.items()]
+    writes.append((meta.document(ROLLUP_INDEX), {
+        "complete": True,
+        "updated": {str(year): doc["updated_at"] for (_, doc), year in zip(writes, by_year)},
+    }))
+    commit_batched(db, writes)
+    return len(by_year)
+
+
+if __name__ == "__main__":
+    # python firestore_sync.py rebuild-rollup kevin simon
+    from pathlib import Path
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    if len(sys.argv) < 3 or sys.argv[1] != "rebuild-rollup":
+        sys.exit("usage: python firestore_sync.py rebuild-rollup <user> [<user> ...]")
+
+    firebase_admin.initialize_app(credentials.Certificate(Path(__file__).parent / "firebase_key.json"))
+    db = firestore.client()
+    for user in sys.argv[2:]:
+        years = rebuild_daily_rollup(db, user)
+        print(f"✅ Rebuilt {years} rollup year(s) for '{user}'")
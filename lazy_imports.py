@@ -0,0 +1,29 @@
+"""Deferred imports, so the dashboard only pays for a heavy module on the code path that uses it."""
+
+import importlib
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access.
+
+    importlib's own module locks make the first access safe from several
+    threads (e.g. the parallel participant loads).
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name):
+    """`pa = lazy_import("pyarrow")` behaves like `import pyarrow as pa`, minus the startup cost."""
+    return LazyModule(name)
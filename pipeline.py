@@ -0,0 +1,387 @@
+"""
+The dashboard's data pipeline as plain functions: raw docs to per-day frames,
+stats, goal curves, trendlines, rolling averages, axis ranges and the figure.
+dashboard.py wraps them in its caches and profiler stages;
+benchmarks/bench_pipeline.py imports and times them directly.
+"""
+
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from downsample import window_indices
+from lazy_imports import lazy_import
+from rolling import prefix_sums, rolling_stats
+from storage import WRITTEN_AT
+
+fast_lowess = lazy_import("fast_lowess")
+
+# Fields storage stamps on every doc it writes, with the commit time in UTC.
+# The newest value seen for each one is kept as a high-water mark, so a reload
+# only streams documents written after the previous load instead of the whole
+# collection.
+WATERMARK_FIELDS = (WRITTEN_AT,)
+# Only these fields are read; the watermark field is added for delta queries
+READ_FIELDS = ["date", "weight", "bodyFat"]
+
+# Planned loss: 1.5 % of the starting weight per month
+MONTHLY_LOSS_RATE = 0.015
+DAYS_PER_MONTH = 30.437
+
+# Goal curves and axis ranges work on int64 day numbers (days since 1970-01-01)
+# and float64 weights
+NS_PER_DAY = 86_400_000_000_000
+TIME_RANGES = ["Last 14 Days", "Last 30 Days", "Competition Timeline"]
+# Proleptic ordinal of 1970-01-01, to convert datetime64[D] <-> date.toordinal()
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+ROLLING_WINDOWS = (7, 14, 30)  # days
+
+# Inside the visible window every reading is plotted; outside it (only seen
+# when panning or zooming out) the series is LTTB-downsampled to the on-screen
+# density, so the figure stays the same size however long the history gets.
+CHART_WIDTH_PX = int(os.getenv("CHART_WIDTH_PX", "1200"))
+PX_PER_POINT = 2
+
+
+def aggregate_daily(records):
+    """Per-day mean weight and body fat of raw records, sorted by date."""
+    return records.groupby("date").agg({
+        "weight": "mean",
+        "bodyFat": "mean"
+    }).reset_index().sort_values("date")
+
+
+def records_from_docs(docs):
+    """Firestore docs -> (records indexed by doc id, {watermark field: newest value in the docs})."""
+    new = pd.DataFrame([doc.to_dict() for doc in docs], index=[doc.id for doc in docs])
+
+    latest = {}
+    for field in WATERMARK_FIELDS:
+        if field in new.columns:
+            value = pd.to_datetime(new[field], utc=True, errors="coerce").max()
+            if not pd.isna(value):
+                latest[field] = value
+
+    new = new.reindex(columns=READ_FIELDS).dropna(subset=["date"])
+    new["date"] = pd.to_datetime(new["date"])
+    new[["weight", "bodyFat"]] = new[["weight", "bodyFat"]].apply(pd.to_numeric, errors="coerce")
+    return new, latest
+
+
+def rollup_frame(docs):
+    """Per-day frame straight from rollup docs; they already hold daily means."""
+    parts = []
+    for doc in docs:
+        data = doc.to_dict() if doc.exists else None
+        if not data or not data.get("days"):
+            continue
+        year_start = pd.Timestamp(year=data["year"], month=1, day=1)
+        parts.append(pd.DataFrame({
+            "date": year_start + pd.to_timedelta(np.asarray(data["days"]) - 1, unit="D"),
+            "weight": np.asarray(data["weight"], dtype=float),
+            "bodyFat": np.array([np.nan if v is None else v for v in data["bodyFat"]], dtype=float),
+        }))
+    if not parts:
+        return pd.DataFrame({"date": pd.Series(dtype="datetime64[ns]"), "weight": [], "bodyFat": []})
+    return pd.concat(parts, ignore_index=True)
+
+
+def window_bounds(time_range, today, goal_start_date, goal_end_date):
+    """(x_min, x_max) of the chart for a time range; "Competition Timeline" is the goal window."""
+    if time_range == "Last 14 Days":
+        x_min = (today - pd.Timedelta(days=14)).normalize()
+        x_max = (today + pd.Timedelta(days=7)).normalize()
+    elif time_range == "Last 30 Days":
+        x_min = (today - pd.Timedelta(days=30)).normalize()
+        x_max = (today + pd.Timedelta(days=10)).normalize()
+    else:  # "Competition Timeline"
+        x_min = goal_start_date
+        x_max = goal_end_date
+    return x_min, x_max
+
+
+def compute_participant_stats(frames, start_weights, goal_start_date, goal_end_date):
+    """
+    Latest and goal weight plus loss for every user, computed on a single
+    long-format frame (date, weight, user) instead of per-user code.
+    """
+    stats = pd.DataFrame(index=pd.Index(list(start_weights), name="user"))
+    stats["start_weight"] = pd.Series(start_weights, dtype=float)
+
+    parts = [df[["date", "weight"]].assign(user=user) for user, df in frames.items() if not df.empty]
+    if not parts:
+        stats[["latest_weight", "goal_weight", "loss", "loss_pct"]] = np.nan
+        return stats
+    long = pd.concat(parts, ignore_index=True)
+    long = long.dropna(subset=["weight"]).sort_values(["user", "date"])
+
+    stats["latest_weight"] = long.groupby("user")["weight"].last()
+
+    months = (goal_end_date - goal_start_date) / pd.Timedelta(days=DAYS_PER_MONTH)
+    stats["goal_weight"] = stats["start_weight"] * (1 - MONTHLY_LOSS_RATE * months)
+    stats["loss"] = stats["start_weight"] - stats["latest_weight"]
+    stats["loss_pct"] = 100 * stats["loss"] / (stats["start_weight"] - stats["goal_weight"])
+    return stats
+
+
+def to_days(dates):
+    """Timestamp(s) -> int64 days since 1970-01-01."""
+    values = np.asarray(dates)
+    if not np.issubdtype(values.dtype, np.datetime64):
+        # Timestamps, strings, ...; pd.to_datetime on a datetime64 column is a slow no-op
+        values = pd.to_datetime(dates).values
+    return values.astype("datetime64[D]").astype(np.int64)
+
+
+def compute_goal_weights(start_weight, start_date, end_date):
+    """Daily goal curve from start_date to end_date as (days, weights) arrays."""
+    start_day, end_day = to_days([start_date, end_date])
+    goal_days = np.arange(start_day, end_day + 1, dtype=np.int64)
+    # Same float steps as dividing a TimedeltaIndex by the month length
+    months = ((goal_days - start_day) * NS_PER_DAY) / pd.Timedelta(days=DAYS_PER_MONTH).value
+    goal_weights = start_weight * (1 - MONTHLY_LOSS_RATE * months)
+    return goal_days, goal_weights
+
+
+def compute_trendline(df, goal_end_date, trend_type="Smooth (LOWESS)"):
+    """Trend (x as datetime64[D], y) extended to goal_end_date, ready to plot."""
+    empty = np.array([], dtype="datetime64[D]"), np.array([])
+    if df.empty:
+        return empty
+
+    x = df["date"].to_numpy().astype("datetime64[D]").astype(np.int64) + EPOCH_ORDINAL
+    y = df["weight"].to_numpy(dtype=float)
+
+    mask = np.isfinite(y)
+    x = x[mask]
+    y = y[mask]
+
+    if len(x) < 3:
+        return empty
+
+    try:
+        end_x = goal_end_date.toordinal()
+        if trend_type == "Linear":
+            coeffs = np.polyfit(x, y, deg=1)
+            m, b = coeffs
+            trend_x = np.array([x[0], end_x])
+            trend_y = m * trend_x + b
+        else:
+            # LOWESS smoothing
+            smoothed = fast_lowess.lowess(y, x, frac=0.3)
+            last_x, last_y = smoothed[-2:, 0], smoothed[-2:, 1]
+            local_slope = (last_y[1] - last_y[0]) / (last_x[1] - last_x[0])
+            extend_x = np.linspace(smoothed[-1, 0], end_x, 30)
+            extend_y = smoothed[-1, 1] + local_slope * (extend_x - smoothed[-1, 0])
+            trend_x = np.concatenate([smoothed[:, 0], extend_x])
+            trend_y = np.concatenate([smoothed[:, 1], extend_y])
+        trend_dates = (np.floor(trend_x).astype(np.int64) - EPOCH_ORDINAL).astype("datetime64[D]")
+        return trend_dates, trend_y
+    except Exception as e:
+        print(f"⚠️ Trendline error: {e}")
+        return empty
+
+
+def rolling_frames(df):
+    """
+    Trailing 7/14/30-day mean weight and weekly loss (kg/week, from the
+    least-squares slope over the window) on every day of the frame:
+    {window: DataFrame(date, weight, weekly_loss)}. All window sizes share
+    one set of prefix sums.
+    """
+    if df.empty:
+        empty = pd.DataFrame({
+            "date": pd.Series(dtype="datetime64[ns]"), "weight": pd.Series(dtype=float),
+            "weekly_loss": pd.Series(dtype=float),
+        })
+        return dict.fromkeys(ROLLING_WINDOWS, empty)
+
+    days = to_days(df["date"])
+    table = prefix_sums(days, df["weight"].to_numpy(dtype=float))
+    rolling = {}
+    for window in ROLLING_WINDOWS:
+        mean, slope = rolling_stats(days, None, window, table=table)
+        rolling[window] = pd.DataFrame({"date": df["date"].to_numpy(), "weight": mean, "weekly_loss": -7 * slope})
+    return rolling
+
+
+def plot_points(df, x_min, x_max):
+    """Rows of df to plot for the window [x_min, x_max]."""
+    if df.empty:
+        return df
+    df = df if df["date"].is_monotonic_increasing else df.sort_values("date")
+    x = df["date"].to_numpy().astype("datetime64[ns]").astype(np.int64)
+    idx = window_indices(
+        x, df["weight"].to_numpy(dtype=float), x_min.value, x_max.value, CHART_WIDTH_PX // PX_PER_POINT
+    )
+    return df.iloc[idx]
+
+
+def aligned_ranges(windows, goals, ref_days, ref_weights):
+    """
+    Compute y-axis ranges so every participant's goal line aligns with the
+    first one's (goals[0], whose data ref_days/ref_weights sets the margins),
+    with proportional scaling and margin, for all (x1, x2) day windows at once.
+    Returns a (windows, goals, 2) array, NaN where a goal curve is empty (or,
+    as before, where the first goal line is flat across the window).
+    """
+    windows = np.asarray(windows, dtype=np.int64).reshape(-1, 2)
+    ranges = np.full((len(windows), len(goals), 2), np.nan)
+    if not goals or len(goals[0][0]) == 0:
+        print("⚠️ Empty goal arrays — cannot compute alignment.")
+        return ranges
+
+    # Goal weights interpolated at the window edges, one column per edge
+    y1_start, y1_end = np.interp(windows, *goals[0]).T
+    y1_range = y1_start - y1_end
+
+    # Max/min visible weight of the reference participant in every window
+    # (NaN, like pandas, when the window only has missing weights)
+    visible = (ref_days >= windows[:, :1]) & (ref_days <= windows[:, 1:])
+    valid = visible & np.isfinite(ref_weights)
+    has_data = visible.any(axis=1)
+    has_weight = valid.any(axis=1)
+    visible_max = np.where(has_weight, np.where(valid, ref_weights, -np.inf).max(axis=1, initial=-np.inf), np.nan)
+    visible_min = np.where(has_weight, np.where(valid, ref_weights, np.inf).min(axis=1, initial=np.inf), np.nan)
+    max_value = np.where(has_data, visible_max, np.maximum(y1_start, y1_end))
+    min_value = np.where(has_data, np.minimum(visible_min, y1_end), np.minimum(y1_start, y1_end))
+
+    margin1 = max_value - y1_start + 1
+    margin2 = y1_end - min_value + 1
+    ranges[:, 0] = np.column_stack([y1_end - margin2, y1_start + margin1])
+
+    # Scale every other goal line so its start and end visually match the first
+    for i, (goal_days, goal_weights) in enumerate(goals[1:], start=1):
+        if len(goal_days) == 0:
+            continue
+        y2_start, y2_end = np.interp(windows, goal_days, goal_weights).T
+        y2_range = y2_start - y2_end
+        ranges[:, i] = np.column_stack([
+            y2_end - y2_range/y1_range * margin2, y2_start + y2_range/y1_range * margin1
+        ])
+
+    return ranges
+
+
+def axis_ranges(today, goals, df_ref, goal_start_date, goal_end_date):
+    """
+    Aligned y-ranges for every predefined time range in one pass:
+    {time_range: [[low, high] or None per goal]}. df_ref is the first
+    plotted user's frame.
+    """
+    windows = [to_days(window_bounds(time_range, today, goal_start_date, goal_end_date)) for time_range in TIME_RANGES]
+    if df_ref.empty:
+        ref_days, ref_weights = np.array([], dtype=np.int64), np.array([])
+    else:
+        ref_days, ref_weights = to_days(df_ref["date"]), df_ref["weight"].to_numpy(dtype=float)
+
+    ranges = aligned_ranges(windows, goals, ref_days, ref_weights)
+    aligned = [len(goals[0][0]) > 0 and len(goal_days) > 0 for goal_days, _ in goals] if goals else []
+    return {
+        time_range: [r.tolist() if ok else None for r, ok in zip(window_ranges, aligned)]
+        for time_range, window_ranges in zip(TIME_RANGES, ranges)
+    }
+
+
+def build_figure(show_trendlines, trend_type, rolling_window, x_min, x_max,
+                 plotted, frames, goals, trends, rolling, stats, y_ranges):
+    """
+    The chart for one view: per plotted user their readings (downsampled
+    outside the window), rolling average, goal curve and trendline, on
+    y-axes scaled by y_ranges (aligned_ranges()).
+    """
+    # The first participant owns the left axis, the second the right one; any
+    # further participants get hidden overlaid axes. y_ranges (aligned_ranges())
+    # scale every axis so all goal lines coincide.
+    fig = go.Figure()
+    for axis_no, p in enumerate(plotted, start=1):
+        uid, name, color = p["id"], p["name"], p["color"]
+        yaxis = f"y{axis_no}"
+        df = plot_points(frames[uid], x_min, x_max)
+        goal_days, goal_weights = goals[uid]
+        trend_x, trend_y = trends[uid]
+
+        if not df.empty:
+            fig.add_trace(go.Scatter(
+                x=df["date"], y=df["weight"],
+                mode="lines+markers", name=name, yaxis=yaxis, line=dict(color=color), connectgaps=True, showlegend=True
+            ))
+
+        if rolling_window:
+            df_rolling = plot_points(rolling[uid][rolling_window], x_min, x_max)
+            if not df_rolling.empty:
+                fig.add_trace(go.Scatter(
+                    x=df_rolling["date"], y=df_rolling["weight"],
+                    mode="lines", name=f"{name} {rolling_window}-Day Average",
+                    line=dict(color=color, width=3), opacity=0.5,
+                    yaxis=yaxis,
+                    showlegend=False
+                ))
+
+        # Goal trendline — do NOT include in legend
+        fig.add_trace(go.Scatter(
+            x=pd.to_datetime(goal_days, unit="D"), y=goal_weights,
+            mode="lines", name=f"{name} Goal Trendline",
+            line=dict(dash="dot", color="gray"),
+            yaxis=yaxis,
+            showlegend=False
+        ))
+
+        if show_trendlines and len(trend_x) > 0:
+            fig.add_trace(go.Scatter(
+                x=trend_x, y=trend_y,
+                mode="lines",
+                line=dict(dash="dot", color=color),
+                name=f"{name} Trend",
+                yaxis=yaxis,
+                showlegend=False
+            ))
+
+        # Goal weight line across the trend window
+        fig.add_trace(go.Scatter(
+                x=trend_x, y=np.full(len(trend_x), stats.loc[uid, "goal_weight"]),
+                mode="lines",
+                line=dict(dash="dot", color="red"),
+                name=f"{name} Goal Trend",
+                yaxis=yaxis,
+                showlegend=False
+            ))
+
+    x_range = [x_min, x_max]
+
+    fig.update_layout(
+        showlegend=False,
+        height=500,
+        xaxis=dict(
+            title="Date",
+            range=x_range,  # Keep manual range logic
+            type="date"
+        )
+    )
+
+    for axis_no, (p, y_range) in enumerate(zip(plotted, y_ranges), start=1):
+        if axis_no == 1:
+            fig.update_layout(yaxis=dict(
+                title=p["name"],
+                side="left",
+                range=y_range,
+                showgrid=True,
+                tickformat=".1f"
+            ))
+        elif y_range is not None:
+            fig.update_layout({f"yaxis{axis_no}": dict(
+                title=p["name"] if axis_no == 2 else None,
+                overlaying="y",
+                side="right",
+                range=y_range,
+                showgrid=False,
+                visible=axis_no == 2,
+                tickformat=".1f",
+                anchor="x",
+                matches=None
+            )})
+
+    return fig
@@ -0,0 +1,41 @@
+"""Trailing calendar-day window statistics from prefix sums: O(n) per window size, whatever its length."""
+
+import numpy as np
+
+
+def prefix_sums(days, values):
+    """
+    Running sums of (count, x, x², y, xy) over the finite readings, with a
+    leading zero row, so any index range [lo, hi) sums as table[:, hi] - table[:, lo].
+    x is the day number relative to the first day, to keep the sums small.
+    """
+    days = np.asarray(days, dtype=np.int64)
+    y = np.asarray(values, dtype=float)
+    valid = np.isfinite(y)
+    x = (days - days[0]).astype(float) if len(days) else np.array([])
+    terms = np.where(valid, np.stack([np.ones_like(y), x, x * x, y, x * y]), 0.0)
+    table = np.zeros((5, len(y) + 1))
+    np.cumsum(terms, axis=1, out=table[:, 1:])
+    return table
+
+
+def rolling_stats(days, values, window, table=None):
+    """
+    For every day d of the sorted day numbers `days`: the mean of the readings
+    on days (d - window, d], and their least-squares slope per day. The mean is
+    NaN without readings, the slope with fewer than two distinct days.
+    Pass `table` (prefix_sums()) to reuse it across window sizes.
+    """
+    days = np.asarray(days, dtype=np.int64)
+    if table is None:
+        table = prefix_sums(days, values)
+    hi = np.arange(1, len(days) + 1)
+    lo = np.searchsorted(days, days - window, side="right")
+    n, sx, sxx, sy, sxy = table[:, hi] - table[:, lo]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(n > 0, sy / n, np.nan)
+        denominator = n * sxx - sx * sx
+        # Rounding leaves tiny non-zero denominators for single-day windows
+        slope = np.where(denominator > 1e-9 * np.maximum(n * sxx, 1), (n * sxy - sx * sy) / denominator, np.nan)
+    return mean, slope
@@ -0,0 +1,196 @@
+"""
+Per-run metrics for the scrapers: external API calls, storage reads and
+writes (Firestore or SQLite, see storage.py), retries and errors, with their
+latency.
+
+A scraper calls start_run("garmin") once; from then on call() and friends
+(also used by firestore_sync) record into that run, and when the process exits
+the run is written as
+- a Prometheus textfile (SCRAPER_METRICS_DIR/scraper_<job>.prom, for the node
+  exporter's textfile collector: the last run's values as gauges), and
+- one JSON line appended to SCRAPER_METRICS_DIR/scraper_runs.jsonl, to follow
+  cost and throughput over time.
+Without start_run() (e.g. the dashboard's manual entry) nothing is recorded.
+"""
+
+import atexit
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Set SCRAPER_METRICS_DIR to "" to turn the output files off
+METRICS_DIR = os.getenv("SCRAPER_METRICS_DIR", str(Path(__file__).parent / "metrics"))
+JSONL_NAME = "scraper_runs.jsonl"
+
+_run = None
+
+
+def start_run(job):
+    """Start recording for this process; the metrics are written at exit."""
+    global _run
+    _run = {
+        "job": job,
+        "started": time.time(),
+        "started_monotonic": time.monotonic(),
+        "lock": threading.Lock(),
+        "calls": {},  # (kind, op) -> {"count", "errors", "seconds", "reads", "writes"}
+        "retries": {},  # op -> count
+        "errors": {},  # op -> count, failures the scraper gave up on
+    }
+    atexit.register(_write_at_exit, _run)
+    return _run
+
+
+@contextmanager
+def call(kind, op, reads=0, writes=0):
+    """
+    Time one external call of `kind`: "api", or the storage backend's name
+    ("firestore", "sqlite") for storage calls. An exception
+    counts as an error of the call (and its documents as not read or written)
+    and is re-raised. The yielded dict takes document counts only known
+    afterwards, e.g. stats["reads"] = len(docs).
+    """
+    stats = {"reads": reads, "writes": writes}
+    if _run is None:
+        yield stats
+        return
+
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield stats
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        with _run["lock"]:
+            entry = _run["calls"].setdefault(
+                (kind, op), {"count": 0, "errors": 0, "seconds": 0.0, "reads": 0, "writes": 0}
+            )
+            entry["count"] += 1
+            entry["errors"] += failed
+            entry["seconds"] += seconds
+            if not failed:
+                entry["reads"] += stats["reads"]
+                entry["writes"] += stats["writes"]
+
+
+def retry(op):
+    """Count a retried call of `op` (e.g. after a 429)."""
+    if _run is not None:
+        with _run["lock"]:
+            _run["retries"][op] = _run["retries"].get(op, 0) + 1
+
+
+def error(op):
+    """Count a failure the scraper gave up on (a failed login, a window left unfetched); the run is then unsuccessful."""
+    if _run is not None:
+        with _run["lock"]:
+            _run["errors"][op] = _run["errors"].get(op, 0) + 1
+
+
+def summary(run):
+    """The run as a JSON-ready dict."""
+    calls = [
+        {"kind": kind, "op": op, **{k: round(v, 4) if k == "seconds" else v for k, v in entry.items()}}
+        for (kind, op), entry in sorted(run["calls"].items())
+    ]
+    # A call that raised may have been retried or expected (e.g. no data for a
+    # window); the run only failed if the scraper gave up on something
+    errors = sum(run["errors"].values())
+    return {
+        "job": run["job"],
+        "started": datetime.datetime.fromtimestamp(run["started"]).isoformat(timespec="seconds"),
+        "duration_seconds": round(time.monotonic() - run["started_monotonic"], 3),
+        "success": errors == 0,
+        "api_calls": sum(c["count"] for c in calls if c["kind"] == "api"),
+        "storage_reads": sum(c["reads"] for c in calls if c["kind"] != "api"),
+        "storage_writes": sum(c["writes"] for c in calls if c["kind"] != "api"),
+        "retries": sum(run["retries"].values()),
+        "call_errors": sum(c["errors"] for c in calls),
+        "errors": errors,
+        "calls": calls,
+        "retries_by_op": dict(run["retries"]),
+        "errors_by_op": dict(run["errors"]),
+    }
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+def prometheus_text(result):
+    """Render summary() in the Prometheus text exposition format."""
+    job = result["job"]
+    gauges = {
+        "scraper_last_run_timestamp_seconds": ("Start of the last run (unix time).", [
+            (_labels(job=job), datetime.datetime.fromisoformat(result["started"]).timestamp()),
+        ]),
+        "scraper_last_run_duration_seconds": ("Wall time of the last run.", [
+            (_labels(job=job), result["duration_seconds"]),
+        ]),
+        "scraper_last_run_success": ("1 if the scraper gave up on nothing in the last run.", [
+            (_labels(job=job), int(result["success"])),
+        ]),
+        "scraper_last_run_calls": ("External calls made in the last run.", [
+            (_labels(job=job, kind=c["kind"], op=c["op"]), c["count"]) for c in result["calls"]
+        ]),
+        "scraper_last_run_call_errors": ("External calls that raised in the last run.", [
+            (_labels(job=job, kind=c["kind"], op=c["op"]), c["errors"]) for c in result["calls"]
+        ]),
+        "scraper_last_run_call_seconds": ("Time spent in external calls in the last run.", [
+            (_labels(job=job, kind=c["kind"], op=c["op"]), c["seconds"]) for c in result["calls"]
+        ]),
+        "scraper_last_run_storage_reads": ("Documents (or rows) read from storage in the last run.", [
+            (_labels(job=job, kind=c["kind"], op=c["op"]), c["reads"]) for c in result["calls"] if c["kind"] != "api"
+        ]),
+        "scraper_last_run_storage_writes": ("Documents (or rows) written to storage in the last run.", [
+            (_labels(job=job, kind=c["kind"], op=c["op"]), c["writes"]) for c in result["calls"] if c["kind"] != "api"
+        ]),
+        "scraper_last_run_retries": ("Retried calls in the last run.", [
+            (_labels(job=job, op=op), count) for op, count in result["retries_by_op"].items()
+        ]),
+        "scraper_last_run_errors": ("Failures the scraper gave up on in the last run.", [
+            (_labels(job=job, op=op), count) for op, count in result["errors_by_op"].items()
+        ]),
+    }
+
+    lines = []
+    for name, (help_text, samples) in gauges.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        lines += [f"{name}{labels} {value}" for labels, value in samples]
+    return "\n".join(lines) + "\n"
+
+
+def write_run(run, metrics_dir=METRICS_DIR):
+    """Write the run's textfile (atomically, the collector may read it any time) and append its JSON line."""
+    result = summary(run)
+    directory = Path(metrics_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    prom_path = directory / f"scraper_{run['job']}.prom"
+    tmp_path = prom_path.with_suffix(".prom.tmp")
+    tmp_path.write_text(prometheus_text(result))
+    os.replace(tmp_path, prom_path)
+
+    with open(directory / JSONL_NAME, "a") as f:
+        f.write(json.dumps(result) + "\n")
+    return result
+
+
+def _write_at_exit(run):
+    if getattr(sys, "last_value", None) is not None:
+        # The scraper died on an uncaught exception
+        run["errors"]["uncaught"] = run["errors"].get("uncaught", 0) + 1
+    if not METRICS_DIR:
+        return
+    try:
+        write_run(run)
+    except OSError as e:
+        print(f"⚠️ Writing scraper metrics failed: {e}")
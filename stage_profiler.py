@@ -0,0 +1,81 @@
+"""Per-rerun stage timings for the dashboard's ?profile=1 debug panel."""
+
+import json
+import logging
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# One JSON line per finished stage, e.g.
+# {"event": "stage", "run": "3f9a1c2b", "stage": "firestore_range", "user": "kevin", "docs": 412, "ms": 180.4, ...}
+logger = logging.getLogger("dashboard.profile")
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+class StageProfiler:
+    """
+    Collects one record per timed stage of a script run and logs each as a
+    structured line when it finishes. Only the creating thread and threads
+    that attach() (the run's loader threads) are timed: background reloads and
+    listener callbacks outlive the run, so there the profiler is a no-op, as
+    it is everywhere when disabled.
+    """
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.run_id = uuid.uuid4().hex[:8]
+        self.started = time.perf_counter()
+        self.records = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.attach()
+
+    def attach(self):
+        """Time stages run on the calling thread too."""
+        self._local.attached = True
+
+    def _active(self):
+        return self.enabled and getattr(self._local, "attached", False)
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """Time the block; the yielded dict takes extra fields (doc counts, sizes, ...)."""
+        if not self._active():
+            yield {}
+            return
+
+        parent = getattr(self._local, "record", None)
+        record = {"stage": name, **fields}
+        if parent is not None and "user" in parent:
+            record.setdefault("user", parent["user"])
+        self._local.record = record
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["start_ms"] = round((started - self.started) * 1000, 1)
+            record["ms"] = round((time.perf_counter() - started) * 1000, 2)
+            self._local.record = parent
+            with self._lock:
+                self.records.append(record)
+            logger.info(json.dumps({"event": "stage", "run": self.run_id, **record}, default=str))
+
+    def note(self, **fields):
+        """Add fields to this thread's innermost running stage, e.g. note(cache="miss") in a cached function."""
+        record = getattr(self._local, "record", None) if self._active() else None
+        if record is not None:
+            record.update(fields)
+
+    def finish(self):
+        """Log the run total; returns it in ms."""
+        total_ms = round((time.perf_counter() - self.started) * 1000, 1)
+        if self.enabled:
+            logger.info(json.dumps({"event": "rerun", "run": self.run_id, "ms": total_ms, "stages": len(self.records)}))
+        return total_ms
@@ -0,0 +1,369 @@
+"""
+Storage backends for the weight data: Firestore, or an embedded SQLite file
+for self-hosted deployments and offline work.
+
+    STORAGE_BACKEND=sqlite SQLITE_PATH=weights.sqlite3 streamlit run dashboard.py
+
+Both backends take the same calls (meta docs, weight docs as objects with .id
+and .to_dict(), watermarks, the nearest-day weight). The SQLite one also has
+aggregates=True: daily means and range filters run as SQL, so the dashboard
+asks it for the per-day frame directly instead of merging raw docs or
+reading rollups. Firestore has live=True: it can push changes to listeners.
+"""
+
+import datetime
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import scrape_metrics
+from lazy_imports import lazy_import
+
+gcf = lazy_import("google.cloud.firestore")
+firestore_sync = lazy_import("firestore_sync")
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "firestore")
+SQLITE_PATH = os.getenv("SQLITE_PATH", str(Path(__file__).parent / "weights.sqlite3"))
+
+# Set by put_weights on every weight doc it writes: the commit time, in UTC
+# (Firestore's server time). Readers use it as their high-water mark.
+WRITTEN_AT = "written_at"
+# Fields the writers store on a weight doc; the SQLite table has one column each
+WEIGHT_FIELDS = ("date", "weight", "bodyFat", "scraped_at", "entryTime", "source", WRITTEN_AT)
+
+
+# The mark before any stamp, for a delta read from the start
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _utc_text(moment):
+    """A UTC datetime as fixed-width ISO text, so SQLite compares stamps as strings in time order."""
+    return moment.astimezone(datetime.timezone.utc).isoformat(timespec="microseconds")
+
+
+class StoredDoc:
+    """A weight or meta document as the backends return it (the Firestore snapshot interface the callers use)."""
+
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FirestoreStorage:
+    """users/{user}/weight_data and users/{user}/meta in Firestore."""
+
+    name = "firestore"
+    aggregates = False
+    live = True
+
+    def __init__(self, client_factory):
+        # Called on first use, so nothing connects (or imports the gRPC
+        # stack) until data is actually read or written
+        self._client_factory = client_factory
+        self._db = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = self._client_factory()
+        return self._db
+
+    def _user(self, user):
+        return self.db.collection("users").document(user)
+
+    def _weights(self, user):
+        return self._user(user).collection("weight_data")
+
+    def get_meta(self, user, name):
+        """Meta doc `name` as a dict, or None if it does not exist."""
+        doc = self._user(user).collection("meta").document(name).get()
+        return doc.to_dict() if doc.exists else None
+
+    def set_meta(self, user, name, data):
+        self._user(user).collection("meta").document(name).set(data)
+
+    def put_weights(self, user, docs, delete=()):
+        """
+        Set (doc_id, data) weight docs, stamped with their batch's server
+        commit time, delete the (doc_id, date) docs in `delete` in the same
+        batches, and update the daily rollup of all their dates. Returns the
+        number of docs set.
+        """
+        collection = self._weights(user)
+        written = firestore_sync.commit_batched(self.db, [
+            *((collection.document(doc_id), data) for doc_id, data in docs),
+            *((collection.document(doc_id), None) for doc_id, _ in delete),
+        ], stamp_field=WRITTEN_AT)
+        if written:
+            dates = [data["date"] for _, data in docs] + [date for _, date in delete]
+            firestore_sync.update_daily_rollup(self.db, user, dates)
+        return len(docs)
+
+    def latest_marks(self, user, fields):
+        """Newest value of each watermark field (None if no doc has it), one single-doc query per field."""
+        marks = {}
+        for field in fields:
+            latest = list(
+                self._weights(user).select([field])
+                .order_by(field, direction=gcf.Query.DESCENDING).limit(1).stream()
+            )
+            marks[field] = latest[0].to_dict().get(field) if latest else None
+        return marks
+
+    def weight_docs(self, user, fields, since, until=None):
+        """Docs dated since <= date < until, reading only `fields`."""
+        query = self._weights(user).select(fields).where(filter=gcf.FieldFilter("date", ">=", since))
+        if until is not None:
+            query = query.where(filter=gcf.FieldFilter("date", "<", until))
+        return list(query.stream())
+
+    def new_weight_docs(self, user, fields, marks):
+        """Docs stamped after the marks ({field: UTC datetime or None}), whatever their date."""
+        docs = {}
+        for field, mark in marks.items():
+            query = self._weights(user).select(fields + [field]).where(filter=gcf.FieldFilter(field, ">", mark or EPOCH))
+            for doc in query.stream():
+                docs[doc.id] = doc
+        return list(docs.values())
+
+    def nearest_day_weight(self, user, day_str):
+        """
+        Mean weight of the day with docs closest to day_str (earlier day on a
+        tie), from two single-doc queries plus that day's docs; None if there is none.
+        """
+        collection = self._weights(user).select(["date"])
+        before = collection.where(filter=gcf.FieldFilter("date", "<=", day_str)).order_by("date", direction=gcf.Query.DESCENDING)
+        after = collection.where(filter=gcf.FieldFilter("date", ">=", day_str)).order_by("date")
+        candidates = [doc.to_dict()["date"] for query in (before, after) for doc in query.limit(1).stream()]
+        if not candidates:
+            return None
+
+        day = pd.Timestamp(day_str)
+        nearest = min(candidates, key=lambda d: (abs((pd.Timestamp(d) - day).days), d))
+        docs = self._weights(user).select(["weight"]).where(filter=gcf.FieldFilter("date", "==", nearest)).stream()
+        weights = [w for w in (doc.to_dict().get("weight") for doc in docs) if w is not None]
+        return float(np.mean(weights)) if weights else None
+
+    def rollup_index(self, user):
+        """The user's rollup index doc (see firestore_sync), {} if there is none."""
+        return self.get_meta(user, firestore_sync.ROLLUP_INDEX) or {}
+
+    def rollup_docs(self, user, years):
+        """The rollup docs of the given years, in one batched read."""
+        meta = self._user(user).collection("meta")
+        return list(self.db.get_all([meta.document(f"rollup_{year}") for year in years]))
+
+    def watch_new_weight_docs(self, user, marks, on_docs):
+        """
+        Listen for docs stamped after the marks ({field: UTC datetime or None}):
+        on_docs(docs) runs on a Firestore thread with the docs added or changed
+        since its last call, starting with any already past the marks.
+        Listeners get whole docs; Firestore does not project them. Returns the
+        watches (.is_active, .unsubscribe()).
+        """
+        def callback(snapshot, changes, read_time):
+            docs = [change.document for change in changes if change.type.name != "REMOVED"]
+            if docs:
+                on_docs(docs)
+
+        return [
+            self._weights(user).where(filter=gcf.FieldFilter(field, ">", mark or EPOCH)).on_snapshot(callback)
+            for field, mark in marks.items()
+        ]
+
+    def watch_rollup_index(self, user, on_change):
+        """
+        Listen to the rollup index, which every rollup update rewrites in the
+        same transaction as its year: on_change(index dict) on each change
+        after the first snapshot. Returns the watches.
+        """
+        seen_first = threading.Event()
+
+        def callback(snapshot, changes, read_time):
+            if not seen_first.is_set():
+                seen_first.set()
+                return
+            on_change(snapshot[0].to_dict() if snapshot and snapshot[0].exists else {})
+
+        index = self._user(user).collection("meta").document(firestore_sync.ROLLUP_INDEX)
+        return [index.on_snapshot(callback)]
+
+
+class SQLiteStorage:
+    """
+    Both collections as two tables of one SQLite file, in WAL mode so the
+    dashboard reads while a scraper writes. Connections are per thread, so a
+    ":memory:" database is only seen by the thread that created it (fine for
+    benchmarks, not for the dashboard's loader threads).
+    """
+
+    name = "sqlite"
+    aggregates = True
+    live = False  # re-queried on the load TTL, which is cheap for a local file
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS weight_data (
+            user TEXT NOT NULL,
+            id TEXT NOT NULL,
+            date TEXT NOT NULL,
+            weight REAL,
+            bodyFat REAL,
+            scraped_at TEXT,
+            entryTime TEXT,
+            source TEXT,
+            PRIMARY KEY (user, id)
+        );
+        CREATE INDEX IF NOT EXISTS weight_data_user_date ON weight_data (user, date);
+        CREATE TABLE IF NOT EXISTS meta (
+            user TEXT NOT NULL,
+            name TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (user, name)
+        );
+    """
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = str(path)
+        self._local = threading.local()
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        connection = self._connection()
+        connection.executescript(self.SCHEMA)
+        # Files created before a field was added get its column
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(weight_data)")}
+        for field in WEIGHT_FIELDS:
+            if field not in columns:
+                connection.execute(f"ALTER TABLE weight_data ADD COLUMN {field} TEXT")
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path)
+            if self.path != ":memory:":
+                connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _columns(fields):
+        unknown = set(fields) - set(WEIGHT_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown weight fields: {sorted(unknown)}")
+        return ", ".join(fields)
+
+    def _docs(self, fields, sql, params):
+        rows = self._connection().execute(f"SELECT id, {self._columns(fields)} FROM weight_data WHERE {sql}", params)
+        return [StoredDoc(row[0], dict(zip(fields, row[1:]))) for row in rows]
+
+    def get_meta(self, user, name):
+        row = self._connection().execute("SELECT data FROM meta WHERE user = ? AND name = ?", (user, name)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_meta(self, user, name, data):
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO meta (user, name, data) VALUES (?, ?, ?)", (user, name, json.dumps(data))
+            )
+
+    def put_weights(self, user, docs, delete=()):
+        """
+        Upsert (doc_id, data) weight docs and delete the (doc_id, date) docs in
+        `delete` in one transaction, stamped with the UTC time once the write
+        lock is held, so stamps follow commit order. Returns the number of docs set.
+        """
+        writes = len(docs) + len(delete)
+        with scrape_metrics.call(self.name, "put_weights", writes=writes), self._connection() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            stamp = _utc_text(datetime.datetime.now(datetime.timezone.utc))
+            rows = [
+                (user, doc_id, *(stamp if field == WRITTEN_AT else data.get(field) for field in WEIGHT_FIELDS))
+                for doc_id, data in docs
+            ]
+            connection.executemany(
+                f"INSERT OR REPLACE INTO weight_data (user, id, {self._columns(WEIGHT_FIELDS)}) "
+                f"VALUES ({', '.join('?' * (len(WEIGHT_FIELDS) + 2))})",
+                rows,
+            )
+            connection.executemany(
+                "DELETE FROM weight_data WHERE user = ? AND id = ?", [(user, doc_id) for doc_id, _ in delete]
+            )
+        return len(rows)
+
+    def latest_marks(self, user, fields):
+        self._columns(fields)
+        row = self._connection().execute(
+            f"SELECT {', '.join(f'MAX({f})' for f in fields)} FROM weight_data WHERE user = ?", (user,)
+        ).fetchone()
+        return {
+            field: datetime.datetime.fromisoformat(value) if field == WRITTEN_AT and value else value
+            for field, value in zip(fields, row)
+        }
+
+    def weight_docs(self, user, fields, since, until=None):
+        if until is None:
+            return self._docs(fields, "user = ? AND date >= ?", (user, since))
+        return self._docs(fields, "user = ? AND date >= ? AND date < ?", (user, since, until))
+
+    def new_weight_docs(self, user, fields, marks):
+        if not marks:
+            return []
+        self._columns(marks)
+        newer = " OR ".join(f"{field} > ?" for field in marks)
+        values = (_utc_text(mark) if mark else "" for mark in marks.values())
+        return self._docs(list(fields) + list(marks), f"user = ? AND ({newer})", (user, *values))
+
+    def nearest_day_weight(self, user, day_str):
+        # The closest dated day on either side (both index lookups), earlier day on a tie
+        row = self._connection().execute("""
+            WITH candidates AS (
+                SELECT * FROM (SELECT date FROM weight_data WHERE user = :user AND date <= :day ORDER BY date DESC LIMIT 1)
+                UNION ALL
+                SELECT * FROM (SELECT date FROM weight_data WHERE user = :user AND date >= :day ORDER BY date LIMIT 1)
+            )
+            SELECT AVG(weight) FROM weight_data WHERE user = :user AND date = (
+                SELECT date FROM candidates ORDER BY ABS(julianday(date) - julianday(:day)), date LIMIT 1
+            )
+        """, {"user": user, "day": day_str}).fetchone()
+        return row[0]
+
+    def daily_means(self, user, since, until=None):
+        """Per-day mean weight and body fat for since <= date < until, as a (date, weight, bodyFat) frame."""
+        sql = "SELECT date, AVG(weight) AS weight, AVG(bodyFat) AS bodyFat FROM weight_data WHERE user = ? AND date >= ?"
+        params = [user, since]
+        if until is not None:
+            sql += " AND date < ?"
+            params.append(until)
+        frame = pd.read_sql_query(sql + " GROUP BY date ORDER BY date", self._connection(), params=params)
+        frame["date"] = pd.to_datetime(frame["date"])
+        frame[["weight", "bodyFat"]] = frame[["weight", "bodyFat"]].astype(float)
+        return frame
+
+    def rollup_index(self, user):
+        return {}  # daily means come from daily_means()
+
+    def rollup_docs(self, user, years):
+        return []
+
+
+def open_storage(firestore_client=None, backend=STORAGE_BACKEND):
+    """
+    The configured backend (STORAGE_BACKEND: "firestore" or "sqlite").
+    firestore_client is a callable returning a Firestore client; it is only
+    called, on first use, by the Firestore backend.
+    """
+    if backend == "firestore":
+        if firestore_client is None:
+            raise ValueError("The Firestore backend needs a firestore_client callable")
+        return FirestoreStorage(firestore_client)
+    if backend == "sqlite":
+        return SQLiteStorage(SQLITE_PATH)
+    raise ValueError(f"Unknown STORAGE_BACKEND '{backend}' (expected 'firestore' or 'sqlite')")
@@ -7,9 +7,11 @@ from dotenv import load_dotenv
 from withings_api import WithingsApi, WithingsAuth, AuthScope
 from withings_api.common import Credentials
 from firebase_admin import credentials as fb_credentials, firestore, initialize_app
-from google.cloud.firestore_v1.base_query import FieldFilter
 from datetime import datetime as dt, time
-import requests
+
+import scrape_metrics
+from firestore_sync import notify_dashboard, reading_doc_id
+from storage import open_storage
 
 
 
@@ -26,11 +28,18 @@ client_id = os.getenv("WITHINGS_CLIENT_ID")
 client_secret = os.getenv("WITHINGS_CLIENT_SECRET")
 callback_uri = os.getenv("WITHINGS_CALLBACK")
 
-# Firebase setup
-cred_path = Path(__file__).parent / "firebase_key.json"
-cred = fb_credentials.Certificate(cred_path)
-initialize_app(cred)
-db = firestore.client()
+# Firebase setup, only run for the Firestore backend (the default, see storage.py)
+def firestore_client():
+    cred_path = Path(__file__).parent / "firebase_key.json"
+    cred = fb_credentials.Certificate(cred_path)
+    initialize_app(cred)
+    return firestore.client()
+
+storage = open_storage(firestore_client)
+
+# API calls, Firestore reads/writes, retries and errors of this run go to
+# metrics/ at exit (see scrape_metrics.py)
+scrape_metrics.start_run("withings")
 
 # Choose user
 user_id = "simon"  # or "kevin", or dynamic later
@@ -64,7 +73,8 @@ else:
     print("🌐 Authorize with Withings:")
     print(auth.get_authorize_url())
     code = input("🔑 Paste the 'code' from the redirect URL: ").strip()
-    credentials = auth.get_credentials(code)
+    with scrape_metrics.call("api", "get_credentials"):
+        credentials = auth.get_credentials(code)
     with open(TOKEN_FILE, "w") as f:
         json.dump({
             "access_token": credentials.access_token,
@@ -78,7 +88,8 @@ else:
 # Create API and refresh tokens
 api = WithingsApi(credentials)
 try:
-    api.refresh_token()
+    with scrape_metrics.call("api", "refresh_token"):
+        api.refresh_token()
     refreshed = api.get_credentials()
     with open(TOKEN_FILE, "w") as f:
         json.dump({
@@ -91,77 +102,124 @@ try:
     logger.info("🔄 Token refreshed and saved.")
 except Exception as e:
     logger.error(f"❌ Failed to refresh token: {e}")
+    scrape_metrics.error("refresh_token")
     exit()
 
-# Get last Withings sync date
-meta_ref = db.collection("users").document(user_id).collection("meta").document("withings_sync")
-doc = meta_ref.get()
-
-if doc.exists:
-    last_sync_date = doc.to_dict().get("last_date")
-    start_date = datetime.date.fromisoformat(last_sync_date)
-    logger.info(f"🔁 Last Withings sync: {start_date}")
-else:
-    start_date = datetime.date.today() - datetime.timedelta(days=300)
-    logger.info(f"📆 No previous sync found. Starting from {start_date}")
+# Withings measure types kept on a weight doc
+WEIGHT_TYPE = 1
+FAT_RATIO_TYPE = 6
+
+
+def measure_pages(api, lastupdate):
+    """
+    Pages of the measure groups created or changed since `lastupdate` (unix
+    time), each fetched when the caller asks for it, following `more`/`offset`
+    until Withings has nothing left.
+    """
+    offset = None
+    while True:
+        with scrape_metrics.call("api", "measure_get_meas"):
+            page = api.measure_get_meas(startdate=None, enddate=None, lastupdate=lastupdate, offset=offset)
+        yield page
+        if not page.more:
+            return
+        offset = page.offset
+
+
+def group_reading(group):
+    """(ISO date, {"weight", "bodyFat"}) of a measure group, or None if it has no weight."""
+    weight = None
+    fat_percent = None
+    for measure in group.measures:
+        value = measure.value * (10 ** measure.unit)
+        if measure.type == WEIGHT_TYPE:
+            weight = value
+        elif measure.type == FAT_RATIO_TYPE:
+            fat_percent = value
+    if weight is None:
+        return None
+    return group.date.date().isoformat(), {"weight": weight, "bodyFat": fat_percent}
 
-end_date = datetime.date.today()
-end_timestamp = int(dt.now().timestamp())
 
-start_timestamp = int(dt.combine(start_date, time.min).timestamp())
+# Get last Withings sync: the lastupdate of the previous run, or (markers
+# written before incremental sync) the date it reached
+with scrape_metrics.call(storage.name, "sync_marker_get", reads=1):
+    sync_meta = storage.get_meta(user_id, "withings_sync")
 
-# Fetch measurements
+if sync_meta and sync_meta.get("lastupdate"):
+    lastupdate = sync_meta["lastupdate"]
+    logger.info(f"🔁 Last Withings sync: {dt.fromtimestamp(lastupdate)}")
+else:
+    if sync_meta:
+        start_date = datetime.date.fromisoformat(sync_meta.get("last_date"))
+        logger.info(f"🔁 Last Withings sync: {start_date}")
+    else:
+        start_date = datetime.date.today() - datetime.timedelta(days=300)
+        logger.info(f"📆 No previous sync found. Starting from {start_date}")
+    lastupdate = int(dt.combine(start_date, time.min).timestamp())
+
+# Every group measured on or after this date is in the fetch
+full_from = dt.fromtimestamp(lastupdate).date().isoformat()
+
+# Fetch page by page, writing each page's days before asking for the next
+latest_scraped_date = sync_meta.get("last_date") if sync_meta else None
+updatetime = None
+groups_found = 0
+written = 0
 try:
-    measures = api.measure_get_meas(
-        startdate=start_timestamp,
-        enddate=end_timestamp,
-        lastupdate=None
-    )
-    logger.info(f"✅ Found {len(measures.measuregrps)} measurement groups.")
+    for page in measure_pages(api, lastupdate):
+        if updatetime is None:
+            # Server time of the first page: anything changed after it is the next run's
+            updatetime = int(page.updatetime.timestamp())
+        groups_found += len(page.measuregrps)
+        logger.info(f"✅ Found {len(page.measuregrps)} measurement groups.")
+
+        # One doc per weigh-in, keyed by its group, so several a day sit side
+        # by side and a refetched or edited group overwrites only its own doc
+        writes = []
+        for group in page.measuregrps:
+            reading = group_reading(group)
+            if reading is not None:
+                date, values = reading
+                doc_id = reading_doc_id(date, "withings", group.grpid)
+                writes.append((doc_id, {"date": date, **values, "source": "withings"}))
+        if not writes:
+            continue
+        days = sorted({data["date"] for _, data in writes})
+
+        # Docs written before groups were kept separate are keyed by the date
+        # alone and hold one of the day's groups. Where the fetch covers the
+        # whole day again, that group is among the new docs: drop the old one.
+        legacy = [(date, date) for date in days if date >= full_from]
+        try:
+            written += storage.put_weights(user_id, writes, delete=legacy)
+        except Exception as e:
+            logger.error(f"❌ Upload failed: {e}")
+            scrape_metrics.error("upload")
+            exit()
+
+        for doc_id, data in writes:
+            logger.info(f"📤 Saved {doc_id}: {data['weight']:.2f} kg, fat: {data['bodyFat']}")
+        latest_scraped_date = max([latest_scraped_date or "", *days])
 except Exception as e:
     logger.error(f"❌ Error fetching data: {e}")
+    scrape_metrics.error("fetch")
     exit()
 
-if not measures.measuregrps:
+if not groups_found:
     logger.error("⚠️ No new Withings data found.")
-    exit()
 
-# Track latest date scraped
-latest_scraped_date = start_date
-
-# Parse and upload
-for group in measures.measuregrps:
-    date = group.date.date().isoformat()
-    weight = None
-    fat_percent = None
-
-    for measure in group.measures:
-        value = measure.value * (10 ** measure.unit)
-        if measure.type == 1:  # Weight
-            weight = value
-        elif measure.type == 6:  # Fat %
-            fat_percent = value
-
-    if weight is not None:
-        try:
-            db.collection("users").document(user_id).collection("weight_data").document(date).set({
-                "date": date,
-                "weight": weight,
-                "bodyFat": fat_percent
-            })
-            logger.info(f"📤 Uploaded {date}: {weight:.2f} kg, fat: {fat_percent}")
-            # Track latest scraped date
-            if date > latest_scraped_date.isoformat():
-                latest_scraped_date = datetime.date.fromisoformat(date)
-                # after successful Firestore write:
-                requests.get("https://fatboyslim.streamlit.app/?refresh=1")
-        except Exception as e:
-            logger.error(f"❌ Upload failed for {date}: {e}")
+logger.info(f"✅ Uploaded {written} readings.")
+if written:
+    # after successful write:
+    notify_dashboard(user_id, datetime.datetime.now().isoformat())
 
 # Update sync marker
 try:
-    meta_ref.set({"last_date": latest_scraped_date.isoformat()})
+    with scrape_metrics.call(storage.name, "sync_marker_set", writes=1):
+        storage.set_meta(user_id, "withings_sync", {"last_date": latest_scraped_date, "lastupdate": updatetime})
     now = datetime.datetime.now()
-    print(f"{now.strftime('%Y-%m-%d %H:%M:%S')}: Withings Scraper - ✅ Sync marker at: {latest_scraped_date}")
+    print(f"{now.strftime('%Y-%m-%d %H:%M:%S')}: Withings Scraper - ✅ Sync marker at: {dt.fromtimestamp(updatetime)}")
 except Exception as e:
     logger.error(f"❌ Failed to update sync marker: {e}")
+    scrape_metrics.error("sync_marker")